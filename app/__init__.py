@@ -1,4 +1,4 @@
-from flask import Flask, redirect, url_for
+from flask import Flask, jsonify, redirect, url_for
 from flask_jwt_extended import JWTManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -23,6 +23,34 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Инициализация кэша галерей лиц
+    from app.services.face_gallery import face_gallery
+    face_gallery.init_app(app)
+
+    # Инициализация индекса опознавания по всему контингенту
+    from app.services.face_index import face_index
+    face_index.init_app(app)
+
+    # Инициализация буфера живых эталонов лиц
+    from app.services.face_references import live_references
+    live_references.init_app(app)
+
+    # Инициализация пула процессов распознавания
+    from app.services.face_workers import face_workers
+    face_workers.init_app(app)
+
+    # Инициализация кэша пользователей для проверки доступа
+    from app.services.identity import identity_cache
+    identity_cache.init_app(app)
+
+    # Инициализация кэша справочных API фильтров
+    from app.services.lookup_cache import lookup_cache
+    lookup_cache.init_app(app)
+
+    # Инициализация слотов кадров потокового распознавания
+    from app.services.frame_stream import frame_slots
+    frame_slots.init_app(app)
+
     # Импорт моделей
     from app.models.user import User
 
@@ -34,18 +62,26 @@ def create_app():
     app.register_blueprint(admin_bp)
     app.register_blueprint(teacher_bp)
 
+    # Регистрация CLI-команд
+    from app.commands import bootstrap, dispatch_emails, enroll_photos, rebuild_rollups_command, reencode_faces
+    app.cli.add_command(bootstrap)
+    app.cli.add_command(enroll_photos)
+    app.cli.add_command(reencode_faces)
+    app.cli.add_command(dispatch_emails)
+    app.cli.add_command(rebuild_rollups_command)
+
     # Перенаправление на страницу авторизации
     @app.route('/')
     def redirect_to_login():
         return redirect(url_for('auth.login'))
 
-    # Импортируем утилиты для начальной настройки
-    from app.utils import init_roles, init_admin
+    # Готовность воркера для балансировщика: 503, пока модели в пуле распознавания не прогреты
+    @app.route('/ready')
+    def readiness():
+        ready = face_workers.ready
+        return jsonify({'ready': ready}), 200 if ready else 503
 
-    # Используем app_context для операций с базой данных
-    with app.app_context():
-        db.create_all()  # Создаем таблицы, если их нет
-        init_roles()   # Инициализируем роли
-        init_admin()   # Инициализируем администратора
+    # Схема и начальные данные (роли, администратор, версия кодировщика) создаются
+    # командой flask bootstrap при развёртывании, а не при каждом запуске процесса
 
     return app
@@ -0,0 +1,365 @@
+import csv
+import hashlib
+import itertools
+import os
+import re
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+
+from app import db
+from app.models.group import Group
+from app.models.student import Student
+from app.models.face_embedding import FaceEmbedding
+from app.services.embeddings import (active_encoder_version, encoder_settings, ensure_encoder_version, new_embedding,
+                                     replace_student_embedding)
+from app.services.face_gallery import face_gallery
+from app.services.face_index import face_index
+from app.services.lookup_cache import lookup_cache
+from app.services.mail_outbox import OutboxDispatcher
+from app.services.recognition import encode_image_bytes, encode_image_file
+from app.services.reports import rebuild_rollups
+from app.utils import custom_secure_filename, init_admin, init_encoder_versions, init_roles
+
+# Имя файла фото в формате add_students: <студенческий>_<ФИО>.<расширение>
+PHOTO_NAME_RE = re.compile(r'^(\d+)_(.+)\.(png|jpe?g)$', re.IGNORECASE)
+# Наибольшая длина названия группы (столбец groups.groupname)
+GROUP_NAME_LENGTH = Group.groupname.type.length
+
+
+def iter_photos(source):
+    """
+    Перебирает фото в каталоге или zip-архиве со структурой <группа>/<id>_<ФИО>.jpg.
+    Возвращает кортежи (название группы, имя файла, путь к файлу или None, байты фото).
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                parts = info.filename.replace('\\', '/').split('/')
+                if info.is_dir() or len(parts) < 2:
+                    continue
+                yield parts[-2], parts[-1], None, archive.read(info)
+        return
+
+    for root, dirs, files in os.walk(source):
+        # Служебные каталоги (например, временные фото заданий) пропускаются
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                yield os.path.basename(root), name, path, f.read()
+
+
+def load_manifest(path):
+    """Читает CSV с данными новых студентов: student_id, mail, birth_date (ГГГГ-ММ-ДД), education_form."""
+    with open(path, newline='', encoding='utf-8') as f:
+        return {int(row['student_id']): row for row in csv.DictReader(f)}
+
+
+@click.command('enroll-photos')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+              help='CSV с данными новых студентов: student_id,mail,birth_date,education_form.')
+@click.option('--workers', type=int, default=None, help='Число процессов кодирования (по умолчанию — все ядра).')
+@click.option('--batch-size', type=int, default=64, show_default=True,
+              help='Сколько фото кодируется и сохраняется за одну транзакцию.')
+@with_appcontext
+def enroll_photos(source, manifest, workers, batch_size):
+    """
+    Массово добавляет студентов и их кодировки лиц из каталога или zip-архива с фото.
+    Создаёт недостающие группы и студентов (данные новых студентов берутся из --manifest).
+    Для каждого фото сохраняется хеш содержимого: при повторном запуске неизменённые фото
+    пропускаются, поэтому прерванный импорт можно просто запустить снова.
+    """
+    manifest_rows = load_manifest(manifest) if manifest else {}
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    groups = {group.groupname: group for group in Group.query.all()}
+    default_version = ensure_encoder_version(current_app.config['FACE_ENCODING_MODEL'])
+    stats = Counter()
+
+    photos = iter_photos(source)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        while True:
+            batch = list(itertools.islice(photos, batch_size))
+            if not batch:
+                break
+
+            parsed = []
+            for group_name, filename, path, data in batch:
+                match = PHOTO_NAME_RE.match(filename)
+                if not match or not group_name.strip(' .'):
+                    stats['bad_name'] += 1
+                    click.echo(f'Пропущен файл с неподходящим именем: {group_name}/{filename}')
+                    continue
+                parsed.append((group_name, filename, path, data, int(match.group(1)), match.group(2)))
+
+            students = {
+                student.id: student
+                for student in Student.query.filter(Student.id.in_([item[4] for item in parsed])).all()
+            }
+
+            pending = []
+            for group_name, filename, path, data, student_id, fio in parsed:
+                photo_hash = hashlib.sha256(data).hexdigest()
+                student = students.get(student_id)
+                if student and student.photo_hash == photo_hash:
+                    stats['unchanged'] += 1
+                    continue
+                if not student and student_id not in manifest_rows:
+                    stats['no_manifest'] += 1
+                    click.echo(f'Студент {student_id} отсутствует в базе и в манифесте, фото пропущено')
+                    continue
+                if not student and group_name not in groups and len(group_name) > GROUP_NAME_LENGTH:
+                    stats['bad_group'] += 1
+                    click.echo(f'Название группы {group_name} длиннее {GROUP_NAME_LENGTH} символов, фото пропущено')
+                    continue
+                if student and student.group.groupname != group_name:
+                    click.echo(f'Студент {student_id} состоит в группе {student.group.groupname}, '
+                               f'фото из каталога {group_name} сохранено в его группу')
+                pending.append((group_name, filename, path, data, student_id, fio, photo_hash))
+
+            futures = []
+            for group_name, filename, path, data, student_id, fio, photo_hash in pending:
+                student = students.get(student_id)
+                group = student.group if student else groups.get(group_name)
+                version = active_encoder_version(group) if group else default_version
+                futures.append((version, executor.submit(encode_image_bytes, data, encoder_settings(version))))
+            touched_groups = set()
+            touched_students = []
+            new_groups = False
+            for (group_name, filename, path, data, student_id, fio, photo_hash), (version, future) in zip(pending, futures):
+                try:
+                    encodings = future.result()
+                except Exception as e:
+                    stats['error'] += 1
+                    click.echo(f'Ошибка кодирования {group_name}/{filename}: {e}')
+                    continue
+
+                # Существующий студент остаётся в своей группе, в какой бы каталог ни попало фото
+                student = students.get(student_id)
+                group = student.group if student else groups.get(group_name)
+                if group is None:
+                    group = Group(groupname=group_name)
+                    db.session.add(group)
+                    db.session.flush()
+                    groups[group_name] = group
+                    stats['new_groups'] += 1
+                    new_groups = True
+
+                # Части пути из архива не должны выводить за пределы UPLOAD_FOLDER
+                photo_name = custom_secure_filename(filename)
+                target_path = os.path.join(upload_folder, custom_secure_filename(group.groupname), photo_name)
+                if path is None or os.path.abspath(path) != os.path.abspath(target_path):
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    with open(target_path, 'wb') as f:
+                        f.write(data)
+
+                if student is None:
+                    row = manifest_rows[student_id]
+                    student = Student(
+                        id=student_id,
+                        fio=fio.replace('_', ' '),
+                        mail=row['mail'],
+                        birth_date=row['birth_date'],
+                        education_form=row['education_form'],
+                        id_group=group.id
+                    )
+                    db.session.add(student)
+                    stats['new_students'] += 1
+                else:
+                    touched_groups.add(student.id_group)
+                student.photo_path = photo_name
+                student.photo_hash = photo_hash
+                # Фото изменилось: кодировки всех версий по старому фото больше не действительны,
+                # живые эталоны с занятий сохраняются
+                FaceEmbedding.query.filter_by(id_student=student_id, source='enrollment').delete()
+                if len(encodings) == 1:
+                    db.session.add(new_embedding(student_id, version.name, encodings[0]))
+                    stats['encoded'] += 1
+                else:
+                    stats['no_face' if not encodings else 'multiple_faces'] += 1
+                    click.echo(f'{group_name}/{filename}: найдено лиц — {len(encodings)}, кодировка не сохранена')
+                touched_groups.add(group.id)
+                touched_students.append(student_id)
+
+            # Новые группы меняют списки фильтров дашбордов
+            if new_groups:
+                lookup_cache.invalidate()
+            # Каждая пачка фиксируется отдельно, чтобы прерванный импорт продолжался с места остановки
+            db.session.commit()
+            for group_id in touched_groups:
+                face_gallery.invalidate(group_id)
+            # Студенты без новой кодировки тоже попадают в журнал: индекс удалит их старые кодировки
+            face_index.add(touched_students)
+            click.echo(f'Обработано фото: {sum(stats.values())}')
+
+    click.echo(', '.join(f'{key}: {value}' for key, value in sorted(stats.items())) or 'Фото не найдены')
+
+
+@click.command('reencode-faces')
+@click.argument('version')
+@click.option('--jitters', type=int, default=1, show_default=True, help='num_jitters новой версии кодировщика.')
+@click.option('--landmarks', type=click.Choice(['small', 'large']), default='small', show_default=True,
+              help='Модель ключевых точек новой версии кодировщика.')
+@click.option('--group', 'group_names', multiple=True, help='Перекодировать только указанные группы.')
+@click.option('--chunk-size', type=int, default=64, show_default=True,
+              help='Сколько студентов кодируется и сохраняется за одну транзакцию.')
+@click.option('--workers', type=int, default=None, help='Число процессов кодирования (по умолчанию — все ядра).')
+@click.option('--activate/--no-activate', default=True, show_default=True,
+              help='Переключить группы на новую версию после перекодирования.')
+@click.option('--force', is_flag=True, help='Переключить группы, даже если часть студентов не перекодирована.')
+@with_appcontext
+def reencode_faces(version, jitters, landmarks, group_names, chunk_size, workers, activate, force):
+    """
+    Перекодирует фото студентов новой версией кодировщика VERSION.
+    Кодировки новой версии записываются рядом с действующими, поэтому распознавание
+    продолжает работать на старой версии. Группа переключается на VERSION, только когда
+    у всех её студентов с кодировкой активной версии появилась кодировка VERSION.
+    Уже перекодированные студенты пропускаются, поэтому прерванный запуск можно повторить.
+    """
+    try:
+        encoder_version = ensure_encoder_version(version, jitters, landmarks)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    encoder = encoder_settings(encoder_version)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+
+    groups_query = Group.query.order_by(Group.id)
+    if group_names:
+        groups_query = groups_query.filter(Group.groupname.in_(group_names))
+    groups = groups_query.all()
+    stats = Counter()
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for group in groups:
+            group_folder = os.path.join(upload_folder, custom_secure_filename(group.groupname))
+            # Студенты группы, фото которых ещё не закодировано версией VERSION
+            pending = Student.query.filter(
+                Student.id_group == group.id,
+                Student.photo_path != '',
+                ~Student.embeddings.any((FaceEmbedding.encoder_version == version) & (FaceEmbedding.source == 'enrollment'))
+            ).order_by(Student.id).all()
+
+            group_encoded = 0
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                encoded = []
+                futures = [
+                    executor.submit(encode_image_file, os.path.join(group_folder, student.photo_path), encoder)
+                    for student in chunk
+                ]
+                for student, future in zip(chunk, futures):
+                    try:
+                        encodings = future.result()
+                    except Exception as e:
+                        stats['error'] += 1
+                        click.echo(f'Ошибка кодирования фото студента {student.id}: {e}')
+                        continue
+                    if len(encodings) != 1:
+                        stats['no_face' if not encodings else 'multiple_faces'] += 1
+                        click.echo(f'Студент {student.id}: найдено лиц — {len(encodings)}, кодировка не сохранена')
+                        continue
+                    replace_student_embedding(student.id, version, encodings[0])
+                    encoded.append(student.id)
+                    stats['encoded'] += 1
+                db.session.commit()
+                if version == face_index.encoder_version:
+                    face_index.add(encoded)
+                group_encoded += len(encoded)
+            click.echo(f'Группа {group.groupname}: перекодировано студентов — {group_encoded} из {len(pending)}')
+
+            if activate and group.encoder_version != version and (force or _fully_encoded(group, version)):
+                group.encoder_version = version
+                db.session.commit()
+                face_gallery.invalidate(group.id)
+                stats['activated_groups'] += 1
+                click.echo(f'Группа {group.groupname} переключена на версию {version}')
+            elif activate and group.encoder_version != version:
+                click.echo(f'Группа {group.groupname} осталась на прежней версии: не все студенты перекодированы')
+
+    click.echo(', '.join(f'{key}: {value}' for key, value in sorted(stats.items())) or 'Студенты не найдены')
+
+
+def _fully_encoded(group, version):
+    """Есть ли кодировка version у каждого студента группы, распознаваемого активной версией."""
+    active = active_encoder_version(group).name
+    missing = Student.query.filter(
+        Student.id_group == group.id,
+        Student.embeddings.any(FaceEmbedding.encoder_version == active),
+        ~Student.embeddings.any(FaceEmbedding.encoder_version == version)
+    ).count()
+    return missing == 0
+
+
+@click.command('dispatch-emails')
+@click.option('--once', is_flag=True, help='Отправить готовые письма и завершиться.')
+@with_appcontext
+def dispatch_emails(once):
+    """
+    Рассылает письма из outbox через одно SMTP-подключение.
+    По умолчанию работает постоянно, опрашивая очередь раз в MAIL_POLL_INTERVAL секунд.
+    """
+    dispatcher = OutboxDispatcher(current_app.config)
+    poll_interval = current_app.config['MAIL_POLL_INTERVAL']
+    try:
+        while True:
+            stats = dispatcher.dispatch_batch()
+            if any(stats.values()):
+                click.echo(f"Отправлено: {stats['sent']}, отложено: {stats['retry']}, отклонено: {stats['failed']}")
+                # Полная пачка означает, что в очереди, скорее всего, есть ещё письма
+                if sum(stats.values()) >= dispatcher.batch_size:
+                    continue
+            if once:
+                break
+            # Простаивающее соединение закрывается, чтобы сервер не разорвал его сам
+            dispatcher.close()
+            time.sleep(poll_interval)
+    finally:
+        dispatcher.close()
+
+
+@click.command('rebuild-rollups')
+@click.option('--from', 'date_from', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Первый день периода (ГГГГ-ММ-ДД); по умолчанию — с начала учёта.')
+@click.option('--to', 'date_to', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Последний день периода (ГГГГ-ММ-ДД); по умолчанию — до последней отметки.')
+@with_appcontext
+def rebuild_rollups_command(date_from, date_to):
+    """
+    Перестраивает сводные таблицы посещаемости из сырых отметок.
+    Нужна после ручного изменения таблицы attendance в обход приложения.
+    """
+    count = rebuild_rollups(date_from.date() if date_from else None, date_to.date() if date_to else None)
+    db.session.commit()
+    click.echo(f"Сводных строк записано: {count}")
+
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap():
+    """
+    Готовит базу данных к работе: схема, миграции, роли, администратор по умолчанию
+    и версия кодировщика FACE_ENCODING_MODEL. Повторный запуск ничего не меняет.
+    Выполняется один раз при развёртывании, до запуска веб-процессов.
+    """
+    fresh = not inspect(db.engine).has_table('users')
+    # Пустая база создаётся по моделям и сразу помечается последней ревизией;
+    # существующая доводится до неё только миграциями: create_all создал бы новые таблицы
+    # по текущим моделям раньше миграций, которые их создают и заполняют
+    if fresh:
+        db.create_all()
+        stamp()
+    else:
+        upgrade()
+    init_roles()
+    init_admin()
+    init_encoder_versions()
+    click.echo('База данных готова' + (' (создана с нуля)' if fresh else ''))
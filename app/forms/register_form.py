@@ -53,3 +53,17 @@ class RegisterForm(FlaskForm):
         # Проверяем, что возраст не превышает 120 лет
         if (today.year - birth_date.year) > 120:
             raise ValidationError('Возраст не может быть больше 120 лет')
+
+
+class BulkRegisterForm(RegisterForm):
+    """
+    Форма одной строки пакетной регистрации.
+    Уникальность логинов и почт проверяется для всего пакета одним запросом,
+    поэтому построчные запросы к базе отключены.
+    """
+
+    def validate_login(self, field):
+        pass
+
+    def validate_mail(self, field):
+        pass
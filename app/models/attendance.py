@@ -7,6 +7,20 @@ class Attendance(db.Model):
     id_teacher = db.Column(db.Integer, db.ForeignKey('teachers.id', ondelete='CASCADE'), nullable=False)
     id_student = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), nullable=True)
     id_group = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), nullable=False)
+    # Ключ проведения занятия, присылаемый клиентом: повторная отправка с тем же ключом
+    # обновляет ту же отметку посещаемости, а не создаёт новую
+    session_key = db.Column(db.String(36))
     teacher = db.relationship('Teacher', backref=db.backref('attendances', cascade='all, delete-orphan'))
     student = db.relationship('Student', backref=db.backref('attendances', cascade='all, delete-orphan'))
-    group = db.relationship('Group', backref=db.backref('attendances', cascade='all, delete-orphan'))
\ No newline at end of file
+    group = db.relationship('Group', backref=db.backref('attendances', cascade='all, delete-orphan'))
+    __table_args__ = (
+        # Отбор отметок группы или преподавателя за период (полуинтервал по timestamp)
+        db.Index('ix_attendance_group_timestamp', 'id_group', 'timestamp'),
+        db.Index('ix_attendance_teacher_timestamp', 'id_teacher', 'timestamp'),
+        # Каскадное удаление студента и выборки по студенту
+        db.Index('ix_attendance_student', 'id_student'),
+        db.Index('unique_attendance_session_student', 'session_key', 'id_student', unique=True),
+        # Строка «никто не пришёл» (id_student IS NULL) тоже единственна в пределах занятия
+        db.Index('unique_attendance_session_empty', 'session_key', unique=True,
+                 postgresql_where=db.text('id_student IS NULL')),
+    )
@@ -0,0 +1,18 @@
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app import db
+
+# Сводка посещаемости: одна строка на группу, запись преподавателя-предмета и день занятия
+class AttendanceRollup(db.Model):
+    __tablename__ = 'attendance_rollups'
+    id_group = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True)
+    id_teacher = db.Column(db.Integer, db.ForeignKey('teachers.id', ondelete='CASCADE'), primary_key=True)
+    # День занятия по московскому времени
+    day = db.Column(db.Date, primary_key=True)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    # Отсортированные ID присутствовавших студентов
+    present_students = db.Column(ARRAY(db.Integer), nullable=False, default=list)
+    __table_args__ = (
+        # Отчёты преподавателя за период: первичный ключ начинается с группы и для них не подходит
+        db.Index('ix_attendance_rollups_teacher_day', 'id_teacher', 'day'),
+    )
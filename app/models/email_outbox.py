@@ -0,0 +1,19 @@
+from app import db
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body_text = db.Column(db.Text, nullable=False)
+    body_html = db.Column(db.Text)
+    # pending — ожидает отправки, sent — отправлено, failed — попытки исчерпаны
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
+    sent_at = db.Column(db.TIMESTAMP(timezone=True))
+    # Ключ, по которому повторная постановка того же письма в очередь игнорируется
+    dedup_key = db.Column(db.String(100), unique=True)
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
@@ -0,0 +1,7 @@
+from app import db
+
+class EncoderVersion(db.Model):
+    __tablename__ = 'encoder_versions'
+    name = db.Column(db.String(32), primary_key=True)
+    num_jitters = db.Column(db.Integer, nullable=False, default=1)
+    landmarks_model = db.Column(db.String(10), nullable=False, default='small')
@@ -0,0 +1,14 @@
+from app import db
+
+class EnrollmentJob(db.Model):
+    __tablename__ = 'enrollment_jobs'
+    id = db.Column(db.String(36), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    results = db.Column(db.Text, nullable=False, default='[]')
+    error = db.Column(db.Text)
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
+    finished_at = db.Column(db.TIMESTAMP(timezone=True))
+    id_group = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), nullable=False)
+    group = db.relationship('Group', backref=db.backref('enrollment_jobs', cascade='all, delete-orphan'))
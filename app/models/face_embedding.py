@@ -0,0 +1,13 @@
+from app import db
+
+class FaceEmbedding(db.Model):
+    __tablename__ = 'face_embeddings'
+    id = db.Column(db.Integer, primary_key=True)
+    id_student = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), nullable=False)
+    encoder_version = db.Column(db.String(32), db.ForeignKey('encoder_versions.name'), nullable=False)
+    embedding = db.Column(db.LargeBinary, nullable=False)
+    # Источник эталона: enrollment — фото при добавлении студента, live — уверенно распознанный кадр
+    source = db.Column(db.String(16), nullable=False, default='enrollment')
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
+    student = db.relationship('Student', backref=db.backref('embeddings', cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_face_embeddings_student_encoder_version', 'id_student', 'encoder_version'),)
@@ -3,4 +3,5 @@ from app import db
 class Group(db.Model):
     __tablename__ = 'groups'
     id = db.Column(db.Integer, primary_key=True)
-    groupname = db.Column(db.String(10), nullable=False)
\ No newline at end of file
+    groupname = db.Column(db.String(10), nullable=False)
+    encoder_version = db.Column(db.String(32), db.ForeignKey('encoder_versions.name'))
\ No newline at end of file
@@ -6,8 +6,16 @@ class Student(db.Model):
     fio = db.Column(db.String(255), nullable=False)
     mail = db.Column(db.String(255), nullable=False)
     photo_path = db.Column(db.String(255), nullable=False)
+    photo_hash = db.Column(db.String(64))
     birth_date = db.Column(db.Date, nullable=False)
     education_form = db.Column(db.String(40), nullable=False)
-    face_encoding = db.Column(db.Text)
     id_group = db.Column(db.Integer, db.ForeignKey('groups.id', ondelete='CASCADE'), nullable=False)
-    group = db.relationship('Group', backref=db.backref('students', cascade='all, delete-orphan'))
\ No newline at end of file
+    group = db.relationship('Group', backref=db.backref('students', cascade='all, delete-orphan'))
+    __table_args__ = (
+        # Постраничные списки студентов (всех и по группе) в порядке ФИО
+        db.Index('ix_students_fio_id', 'fio', 'id'),
+        db.Index('ix_students_group_fio_id', 'id_group', 'fio', 'id'),
+        # Поиск по началу ФИО и почты без учёта регистра
+        db.Index('ix_students_fio_prefix', db.text('lower(fio) text_pattern_ops')),
+        db.Index('ix_students_mail_prefix', db.text('lower(mail) text_pattern_ops')),
+    )
@@ -13,3 +13,9 @@ class User(db.Model):
     first_start = db.Column(db.Boolean, nullable=False, default=True)
     id_role = db.Column(db.Integer, db.ForeignKey('roles.id'), nullable=False)
     role = db.relationship('Role', backref='users')
+    __table_args__ = (
+        # Постраничный список пользователей в порядке ФИО и поиск по началу ФИО и почты
+        db.Index('ix_users_fio_id', 'fio', 'id'),
+        db.Index('ix_users_fio_prefix', db.text('lower(fio) text_pattern_ops')),
+        db.Index('ix_users_mail_prefix', db.text('lower(mail) text_pattern_ops')),
+    )
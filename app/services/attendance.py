@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytz
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.attendance import Attendance
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+
+
+class AttendanceSessionConflict(Exception):
+    """Ключ занятия уже использован другим преподавателем или для другой группы."""
+
+
+def save_attendance(teacher_id, group_id, attended_ids, session_key=None):
+    """
+    Записывает посещаемость одного занятия пакетным INSERT ... ON CONFLICT.
+    attended_ids — ID пришедших студентов, уже проверенные по составу группы.
+    Если никто не пришёл, записывается одна строка без студента.
+    При повторной отправке с тем же session_key отметка занятия обновляется: сохраняется
+    исходное время, добавляются новые студенты и удаляются снятые отметки.
+    Возвращает время занятия. Ничего не фиксирует — транзакцию завершает вызывающий код.
+    """
+    timestamp = datetime.now(moscow_tz)
+    if session_key:
+        existing = (db.session.query(Attendance.id_teacher, Attendance.id_group, func.min(Attendance.timestamp))
+                    .filter(Attendance.session_key == session_key)
+                    .group_by(Attendance.id_teacher, Attendance.id_group)
+                    .all())
+        if any((teacher, group) != (teacher_id, group_id) for teacher, group, started in existing):
+            raise AttendanceSessionConflict('Ключ занятия уже использован для другого занятия')
+        if existing:
+            timestamp = existing[0][2]
+            stale = Attendance.query.filter(Attendance.session_key == session_key)
+            if attended_ids:
+                stale = stale.filter(or_(Attendance.id_student.is_(None), Attendance.id_student.notin_(attended_ids)))
+            else:
+                stale = stale.filter(Attendance.id_student.isnot(None))
+            stale.delete(synchronize_session=False)
+
+    rows = [
+        {'timestamp': timestamp, 'id_teacher': teacher_id, 'id_student': student_id,
+         'id_group': group_id, 'session_key': session_key}
+        for student_id in attended_ids or [None]
+    ]
+    statement = insert(Attendance).values(rows)
+    if session_key and attended_ids:
+        statement = statement.on_conflict_do_nothing(index_elements=['session_key', 'id_student'])
+    elif session_key:
+        statement = statement.on_conflict_do_nothing(index_elements=['session_key'],
+                                                     index_where=Attendance.id_student.is_(None))
+    db.session.execute(statement)
+    return timestamp
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import numpy as np
+import pytz
+from flask import current_app
+
+from app import db
+from app.models.encoder_version import EncoderVersion
+from app.models.face_embedding import FaceEmbedding
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+
+# Размерность кодировки лица face_recognition
+ENCODING_SIZE = 128
+# Кодировки хранятся в базе как массив float32: 512 байт на студента
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def pack_embedding(encoding):
+    """Преобразует кодировку лица в бинарное представление для таблицы face_embeddings."""
+    return np.asarray(encoding, dtype=EMBEDDING_DTYPE).reshape(ENCODING_SIZE).tobytes()
+
+
+def unpack_embedding(data):
+    """Возвращает кодировку лица из бинарного представления без копирования данных."""
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
+
+def unpack_embeddings(blobs):
+    """Собирает список бинарных кодировок в матрицу N×128 одним вызовом frombuffer."""
+    return np.frombuffer(b''.join(blobs), dtype=EMBEDDING_DTYPE).reshape(-1, ENCODING_SIZE)
+
+
+# ============================================
+# Версии кодировщика
+# ============================================
+
+def encoder_settings(version):
+    """Возвращает параметры face_encodings для версии кодировщика."""
+    return {'num_jitters': version.num_jitters, 'model': version.landmarks_model}
+
+
+def active_encoder_version(group):
+    """
+    Возвращает активную версию кодировщика группы.
+    Для групп без явно выбранной версии используется FACE_ENCODING_MODEL из конфигурации.
+    """
+    name = group.encoder_version or current_app.config['FACE_ENCODING_MODEL']
+    version = db.session.get(EncoderVersion, name)
+    if version is None:
+        raise LookupError(f'Версия кодировщика {name} не зарегистрирована')
+    return version
+
+
+def ensure_encoder_version(name, num_jitters=1, landmarks_model='small'):
+    """Регистрирует версию кодировщика или проверяет, что её параметры не изменились."""
+    version = db.session.get(EncoderVersion, name)
+    if version is None:
+        version = EncoderVersion(name=name, num_jitters=num_jitters, landmarks_model=landmarks_model)
+        db.session.add(version)
+        db.session.flush()
+    elif (version.num_jitters, version.landmarks_model) != (num_jitters, landmarks_model):
+        raise ValueError(f'Версия кодировщика {name} уже существует с другими параметрами')
+    return version
+
+
+def new_embedding(student_id, version_name, encoding, source='enrollment'):
+    """Создаёт эталонную кодировку студента для версии кодировщика."""
+    return FaceEmbedding(
+        id_student=student_id,
+        encoder_version=version_name,
+        embedding=pack_embedding(encoding),
+        source=source,
+        created_at=datetime.now(moscow_tz)
+    )
+
+
+def replace_student_embedding(student_id, version_name, encoding):
+    """Записывает кодировку фото студента для версии кодировщика, заменяя прежнюю; живые эталоны сохраняются."""
+    FaceEmbedding.query.filter_by(id_student=student_id, encoder_version=version_name,
+                                  source='enrollment').delete()
+    db.session.add(new_embedding(student_id, version_name, encoding))
+
+
+# ============================================
+# Центроиды эталонов
+# ============================================
+
+def reference_centroids(owner_ids, references):
+    """
+    Сводит эталоны студентов к центроидам.
+    owner_ids — ID студента для каждой строки references, строки одного студента идут подряд.
+    Возвращает (ID студентов, смещения их эталонов, центроиды, разброс), где разброс —
+    наибольшее расстояние от эталона студента до его центроида.
+    """
+    owner_ids = np.asarray(owner_ids, dtype=np.int64)
+    if not len(owner_ids):
+        empty = np.empty((0, ENCODING_SIZE), dtype=EMBEDDING_DTYPE)
+        return owner_ids, np.zeros(1, dtype=np.int64), empty, np.empty(0, dtype=EMBEDDING_DTYPE)
+    starts = np.flatnonzero(np.concatenate(([True], owner_ids[1:] != owner_ids[:-1])))
+    counts = np.diff(np.append(starts, len(owner_ids)))
+    centroids = (np.add.reduceat(references, starts, axis=0) / counts[:, None]).astype(EMBEDDING_DTYPE)
+    deviations = np.linalg.norm(references - np.repeat(centroids, counts, axis=0), axis=1)
+    spreads = np.maximum.reduceat(deviations, starts).astype(EMBEDDING_DTYPE)
+    return owner_ids[starts], np.append(starts, len(owner_ids)), centroids, spreads
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import as_completed
+from datetime import datetime
+
+import pytz
+from flask import current_app
+
+from app import db
+from app.models.enrollment_job import EnrollmentJob
+from app.models.student import Student
+from app.services.embeddings import active_encoder_version, encoder_settings, new_embedding
+from app.services.face_gallery import face_gallery
+from app.services.face_index import face_index
+from app.services.face_workers import face_workers
+from app.services.recognition import encode_image_file
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+
+# Каталог внутри UPLOAD_FOLDER для фото, ожидающих кодирования
+STAGING_FOLDER = '.staging'
+
+
+def staging_folder(upload_folder, job_id):
+    """Возвращает каталог временного хранения фото задания."""
+    return os.path.join(upload_folder, STAGING_FOLDER, job_id)
+
+
+def new_job_id():
+    """Генерирует идентификатор задания на добавление студентов."""
+    return str(uuid.uuid4())
+
+
+def create_enrollment_job(job_id, group, group_folder, students):
+    """
+    Создаёт задание на добавление студентов и запускает его в фоновом потоке.
+    students — список словарей с данными студентов; фото уже должны лежать в каталоге задания.
+    """
+    job = EnrollmentJob(
+        id=job_id,
+        status='pending',
+        total=len(students),
+        processed=0,
+        results='[]',
+        created_at=datetime.now(moscow_tz),
+        id_group=group.id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    version = active_encoder_version(group)
+    threading.Thread(
+        target=run_enrollment_job,
+        args=(app, job_id, group.id, group_folder, students, version.name, encoder_settings(version)),
+        daemon=True
+    ).start()
+    return job
+
+
+def run_enrollment_job(app, job_id, group_id, group_folder, students, version_name, encoder):
+    """
+    Выполняет задание: параллельно кодирует фото в пуле процессов активной версией
+    кодировщика группы, затем
+    одной транзакцией добавляет студентов и переносит фото в каталог группы.
+    При ошибке транзакции перенесённые фото удаляются, а задание помечается как failed.
+    """
+    with app.app_context():
+        job = db.session.get(EnrollmentJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        moved = []
+        try:
+            results = [{'student_id': s['student_id'], 'fio': s['fio'], 'status': 'ok', 'message': None}
+                       for s in students]
+            embeddings = [None] * len(students)
+            futures = {}
+            processed = 0
+            for index, student in enumerate(students):
+                if student['staged_path']:
+                    futures[face_workers.submit(encode_image_file, student['staged_path'], encoder)] = index
+                else:
+                    results[index].update(status='no_photo', message='Фото не загружено')
+                    processed += 1
+                    _report_progress(job, results, processed)
+
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    encodings = future.result()
+                except Exception as e:
+                    results[index].update(status='error', message=f'Ошибка кодирования фото: {e}')
+                else:
+                    if not encodings:
+                        results[index].update(status='no_face', message='Лицо на фото не найдено')
+                    elif len(encodings) > 1:
+                        results[index].update(status='multiple_faces',
+                                              message=f'На фото найдено несколько лиц ({len(encodings)})')
+                    else:
+                        embeddings[index] = encodings[0]
+                processed += 1
+                _report_progress(job, results, processed)
+
+            os.makedirs(group_folder, exist_ok=True)
+            for student, embedding in zip(students, embeddings):
+                if student['staged_path']:
+                    target_path = os.path.join(group_folder, student['filename'])
+                    shutil.move(student['staged_path'], target_path)
+                    moved.append(target_path)
+                db.session.add(Student(
+                    id=student['student_id'],
+                    fio=student['fio'],
+                    mail=student['mail'],
+                    photo_path=student['filename'] or '',
+                    birth_date=student['birth_date'],
+                    education_form=student['education_form'],
+                    id_group=group_id
+                ))
+                if embedding is not None:
+                    db.session.add(new_embedding(student['student_id'], version_name, embedding))
+            job.status = 'done'
+            job.finished_at = datetime.now(moscow_tz)
+            db.session.commit()
+            face_gallery.invalidate(group_id)
+            face_index.add([s['student_id'] for s, e in zip(students, embeddings) if e is not None])
+        except Exception as e:
+            db.session.rollback()
+            for path in moved:
+                if os.path.exists(path):
+                    os.remove(path)
+            job = db.session.get(EnrollmentJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.now(moscow_tz)
+            db.session.commit()
+        finally:
+            shutil.rmtree(staging_folder(app.config['UPLOAD_FOLDER'], job_id), ignore_errors=True)
+            db.session.remove()
+
+
+def _report_progress(job, results, processed):
+    job.processed = processed
+    job.results = json.dumps(results, ensure_ascii=False)
+    db.session.commit()
+
+
+def job_to_dict(job):
+    """Сериализует задание для API статуса."""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'students': json.loads(job.results),
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
@@ -0,0 +1,238 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from app import db
+from app.models.face_embedding import FaceEmbedding
+from app.models.group import Group
+from app.models.student import Student
+from app.services.embeddings import active_encoder_version, encoder_settings, reference_centroids, unpack_embeddings
+
+# Временный файл старше этого числа секунд остался от упавшего процесса и удаляется при сбросе
+STALE_TMP_AGE = 3600
+
+
+class GroupNotFound(LookupError):
+    """Группы с запрошенным ID нет (например, она удалена)."""
+
+
+class FaceGallery:
+    """
+    Галерея известных лиц одной группы.
+    encodings — центроиды эталонов студентов (строка на студента) для первого прохода
+    сопоставления, references — все эталоны; эталоны студента ids[j] занимают строки
+    ref_offsets[j]:ref_offsets[j + 1]. Имена студентов хранятся в словаре id→ФИО.
+    """
+
+    def __init__(self, group_id, encodings, spreads, references, ref_offsets, ids, names, encoder_version, encoder):
+        self.group_id = group_id
+        # Версия кодировщика галереи и её параметры: живые кадры кодируются так же
+        self.encoder_version = encoder_version
+        self.encoder = encoder
+        self.encodings = encodings
+        self.spreads = spreads
+        self.references = references
+        self.ref_offsets = ref_offsets
+        self.ids = ids
+        self.names = names
+        # Квадраты норм центроидов для быстрого вычисления матрицы расстояний
+        self.sq_norms = np.einsum('ij,ij->i', encodings, encodings, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def student_references(self, column):
+        """Возвращает эталоны студента по номеру его столбца в галерее."""
+        return self.references[self.ref_offsets[column]:self.ref_offsets[column + 1]]
+
+    def column(self, student_id):
+        """Возвращает номер столбца студента в галерее или None."""
+        columns = np.flatnonzero(self.ids == student_id)
+        return int(columns[0]) if len(columns) else None
+
+
+class FaceGalleryCache:
+    """
+    LRU-кэш галерей лиц, ключом которого является ID группы.
+    Галереи сохраняются в общий каталог хоста и отображаются в память через mmap,
+    поэтому все воркеры gunicorn используют одну копию данных.
+    Инвалидация меняет поколение группы, после чего каждый процесс перечитывает галерею.
+    """
+
+    def __init__(self, app=None):
+        self.cache_dir = None
+        self.max_groups = 32
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache_dir = app.config['FACE_CACHE_DIR']
+        self.max_groups = app.config.get('FACE_GALLERY_MAX_GROUPS', 32)
+        os.makedirs(os.path.join(self.cache_dir, 'galleries'), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, 'sessions'), exist_ok=True)
+        app.extensions['face_gallery'] = self
+
+    # ============================================
+    # Галереи групп
+    # ============================================
+
+    def get(self, group_id):
+        """
+        Возвращает галерею группы, при необходимости собирая её из базы данных.
+        Бросает GroupNotFound, если группы нет.
+        """
+        group_id = int(group_id)
+        generation = self._generation(group_id)
+        with self._lock:
+            entry = self._entries.get(group_id)
+            if entry and entry[0] == generation:
+                self._entries.move_to_end(group_id)
+                return entry[1]
+
+        gallery = self._load(group_id, generation)
+        with self._lock:
+            self._entries[group_id] = (generation, gallery)
+            self._entries.move_to_end(group_id)
+            while len(self._entries) > self.max_groups:
+                self._entries.popitem(last=False)
+        return gallery
+
+    def invalidate(self, group_id):
+        """
+        Сбрасывает галерею группы во всех процессах хоста.
+        Вызывается после изменения состава группы или кодировок её студентов.
+        """
+        group_id = int(group_id)
+        generation = uuid.uuid4().hex
+        self._write_atomic(self._generation_path(group_id), generation.encode())
+        with self._lock:
+            self._entries.pop(group_id, None)
+        # Удаляются только файлы прежних поколений; свежие временные файлы не трогаются:
+        # их допишет и переименует процесс, который их создал
+        prefix = f'group_{group_id}.'
+        for path in glob.glob(os.path.join(self.cache_dir, 'galleries', f'{prefix}*.*')):
+            name = os.path.basename(path)
+            if name[len(prefix):].split('.', 1)[0] in (generation, 'gen') and not name.endswith('.tmp'):
+                continue
+            try:
+                if name.endswith('.tmp') and time.time() - os.path.getmtime(path) < STALE_TMP_AGE:
+                    continue
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load(self, group_id, generation):
+        base_path = os.path.join(self.cache_dir, 'galleries', f'group_{group_id}.{generation}')
+        try:
+            return self._read(group_id, base_path)
+        except (FileNotFoundError, KeyError, ValueError):
+            pass
+
+        encodings, references, meta = self._build(group_id)
+        # Метаданные и эталоны пишутся первыми: наличие .npy центроидов означает,
+        # что галерея записана полностью
+        self._write_atomic(f'{base_path}.json', json.dumps(meta).encode())
+        self._save_array(f'{base_path}.refs.npy', references)
+        self._save_array(f'{base_path}.npy', encodings)
+        try:
+            return self._read(group_id, base_path)
+        except (FileNotFoundError, KeyError, ValueError):
+            # Поколение успели сбросить и удалить его файлы: собранная галерея
+            # используется из памяти, следующий запрос прочитает новое поколение
+            return self._gallery(group_id, encodings, references, meta)
+
+    @staticmethod
+    def _save_array(path, array):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _read(cls, group_id, base_path):
+        encodings = np.load(f'{base_path}.npy', mmap_mode='r')
+        references = np.load(f'{base_path}.refs.npy', mmap_mode='r')
+        with open(f'{base_path}.json', 'rb') as f:
+            meta = json.load(f)
+        return cls._gallery(group_id, encodings, references, meta)
+
+    @staticmethod
+    def _gallery(group_id, encodings, references, meta):
+        ids = np.array(meta['ids'], dtype=np.int64)
+        spreads = np.array(meta['spreads'], dtype=np.float32)
+        ref_offsets = np.array(meta['ref_offsets'], dtype=np.int64)
+        names = {int(student_id): fio for student_id, fio in meta['names'].items()}
+        return FaceGallery(group_id, encodings, spreads, references, ref_offsets, ids, names,
+                           meta['encoder_version'], meta['encoder'])
+
+    @staticmethod
+    def _build(group_id):
+        group = db.session.get(Group, group_id)
+        if group is None:
+            raise GroupNotFound(f'Группа {group_id} не найдена')
+        version = active_encoder_version(group)
+        rows = (db.session.query(Student.id, Student.fio, FaceEmbedding.embedding)
+                .join(FaceEmbedding, FaceEmbedding.id_student == Student.id)
+                .filter(Student.id_group == group_id, FaceEmbedding.encoder_version == version.name)
+                .order_by(Student.id, FaceEmbedding.id)
+                .all())
+        references = unpack_embeddings([embedding for student_id, fio, embedding in rows])
+        ids, ref_offsets, encodings, spreads = reference_centroids(
+            [student_id for student_id, fio, embedding in rows], references
+        )
+        meta = {
+            'ids': ids.tolist(),
+            'names': {student_id: fio for student_id, fio, embedding in rows},
+            'spreads': spreads.tolist(),
+            'ref_offsets': ref_offsets.tolist(),
+            'encoder_version': version.name,
+            'encoder': encoder_settings(version),
+        }
+        return encodings, references, meta
+
+    def _generation(self, group_id):
+        try:
+            with open(self._generation_path(group_id), 'rb') as f:
+                return f.read().decode() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _generation_path(self, group_id):
+        return os.path.join(self.cache_dir, 'galleries', f'group_{group_id}.gen')
+
+    # ============================================
+    # Привязка сессий преподавателей к группам
+    # ============================================
+
+    def bind_session(self, user_id, group_id):
+        """Запоминает группу, выбранную преподавателем для распознавания."""
+        self._write_atomic(self._session_path(user_id), str(int(group_id)).encode())
+
+    def session_group(self, user_id):
+        """Возвращает ID группы, выбранной преподавателем, или None."""
+        try:
+            with open(self._session_path(user_id), 'rb') as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _session_path(self, user_id):
+        return os.path.join(self.cache_dir, 'sessions', f'user_{int(user_id)}')
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+face_gallery = FaceGalleryCache()
@@ -0,0 +1,338 @@
+import glob
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from app import db
+from app.models.face_embedding import FaceEmbedding
+from app.services.embeddings import ENCODING_SIZE, reference_centroids, unpack_embeddings
+
+# Минимальная ёмкость инвертированного списка; при заполнении ёмкость удваивается
+_MIN_LIST_CAPACITY = 16
+# Сколько точек на кластер используется для обучения центроидов
+_TRAIN_POINTS_PER_LIST = 64
+# Минимальное число записей журнала, после которого возможно перестроение индекса
+_MIN_REBUILD_ENTRIES = 100
+
+
+def _squared_distances(probes, vectors, vector_norms):
+    """Квадраты евклидовых расстояний probes × vectors через разложение ||a - b||²."""
+    probe_norms = np.einsum('ij,ij->i', probes, probes)
+    squared = probe_norms[:, None] + vector_norms[None, :] - 2.0 * (probes @ vectors.T)
+    return np.maximum(squared, 0.0, out=squared)
+
+
+def train_centroids(vectors, nlist, iterations=10, seed=0):
+    """
+    Обучает центроиды кластеров IVF алгоритмом k-means.
+    Для больших выборок обучение идёт на случайном подмножестве точек.
+    """
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    sample_size = min(len(vectors), nlist * _TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmin(_squared_distances(sample, centroids, np.einsum('ij,ij->i', centroids, centroids)), axis=1)
+        counts = np.bincount(labels, minlength=nlist)
+        # Суммы точек кластеров одним проходом по отсортированным меткам
+        order = np.argsort(labels, kind='stable')
+        filled = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        # Пустые кластеры сохраняют прежний центроид
+        centroids[filled] = sums / counts[filled, None]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Приближённый индекс ближайших соседей (IVF) по кодировкам лиц.
+    Кодировки разложены по инвертированным спискам ближайших центроидов; поиск просматривает
+    только nprobe ближайших к запросу списков. Поддерживает добавление и удаление
+    кодировок без перестроения.
+    """
+
+    def __init__(self, centroids, nlist=0):
+        # Число кластеров для обучения пустого индекса; 0 — по числу первых кодировок
+        self.nlist = nlist
+        self._set_centroids(centroids)
+        # Положение каждой кодировки: ID студента → (номер списка, позиция в списке)
+        self._where = {}
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=0):
+        """
+        Строит индекс по кодировкам; при nlist=0 число кластеров берётся ≈ 4·√N.
+        Индекс без кодировок не имеет центроидов: они обучаются на первых добавленных.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not len(vectors):
+            return cls(np.empty((0, ENCODING_SIZE), dtype=np.float32), nlist)
+        index = cls(train_centroids(vectors, nlist or int(4 * np.sqrt(len(vectors)))), nlist)
+        index.add(ids, vectors)
+        return index
+
+    def _set_centroids(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        nlist = len(self.centroids)
+        self._vectors = [np.empty((_MIN_LIST_CAPACITY, ENCODING_SIZE), dtype=np.float32) for _ in range(nlist)]
+        self._norms = [np.empty(_MIN_LIST_CAPACITY, dtype=np.float32) for _ in range(nlist)]
+        self._ids = [np.empty(_MIN_LIST_CAPACITY, dtype=np.int64) for _ in range(nlist)]
+        self._counts = [0] * nlist
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, student_id):
+        return int(student_id) in self._where
+
+    def add(self, ids, vectors):
+        """Добавляет кодировки; кодировка уже проиндексированного студента заменяется."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not len(vectors):
+            return
+        if not len(self.centroids):
+            # В пустом индексе нет центроидов: они обучаются на первых кодировках
+            self._set_centroids(train_centroids(vectors, self.nlist or int(4 * np.sqrt(len(vectors)))))
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+        lists = np.argmin(_squared_distances(vectors, self.centroids, self.centroid_norms), axis=1)
+        self.remove(ids)
+        for student_id, vector, norm, list_no in zip(ids, vectors, norms, lists):
+            self._append(int(list_no), int(student_id), vector, norm)
+
+    def remove(self, ids):
+        """Удаляет кодировки студентов; на место удалённой переносится последняя в списке."""
+        for student_id in ids:
+            position = self._where.pop(int(student_id), None)
+            if position is None:
+                continue
+            list_no, pos = position
+            last = self._counts[list_no] - 1
+            if pos != last:
+                moved_id = int(self._ids[list_no][last])
+                self._vectors[list_no][pos] = self._vectors[list_no][last]
+                self._norms[list_no][pos] = self._norms[list_no][last]
+                self._ids[list_no][pos] = moved_id
+                self._where[moved_id] = (list_no, pos)
+            self._counts[list_no] = last
+
+    def search(self, probes, k=5, nprobe=16):
+        """
+        Ищет k ближайших студентов для каждой кодировки из probes.
+        Возвращает список (по запросам) списков пар (ID студента, расстояние) по возрастанию расстояния.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if not len(probes) or not len(self):
+            return [[] for _ in range(len(probes))]
+        nprobe = min(nprobe, len(self.centroids))
+        centroid_distances = _squared_distances(probes, self.centroids, self.centroid_norms)
+        nearest_lists = np.argpartition(centroid_distances, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for probe, lists in zip(probes, nearest_lists):
+            lists = [list_no for list_no in lists if self._counts[list_no]]
+            if not lists:
+                results.append([])
+                continue
+            vectors = np.concatenate([self._vectors[i][:self._counts[i]] for i in lists])
+            norms = np.concatenate([self._norms[i][:self._counts[i]] for i in lists])
+            ids = np.concatenate([self._ids[i][:self._counts[i]] for i in lists])
+            distances = np.sqrt(_squared_distances(probe[None, :], vectors, norms)[0])
+            top = min(k, len(ids))
+            nearest = np.argpartition(distances, top - 1)[:top]
+            nearest = nearest[np.argsort(distances[nearest])]
+            results.append([(int(ids[i]), float(distances[i])) for i in nearest])
+        return results
+
+    def _append(self, list_no, student_id, vector, norm):
+        count = self._counts[list_no]
+        if count == len(self._ids[list_no]):
+            capacity = 2 * count
+            self._vectors[list_no] = np.resize(self._vectors[list_no], (capacity, ENCODING_SIZE))
+            self._norms[list_no] = np.resize(self._norms[list_no], capacity)
+            self._ids[list_no] = np.resize(self._ids[list_no], capacity)
+        self._vectors[list_no][count] = vector
+        self._norms[list_no][count] = norm
+        self._ids[list_no][count] = student_id
+        self._counts[list_no] = count + 1
+        self._where[student_id] = (list_no, count)
+
+
+class FaceIndex:
+    """
+    Индекс центроидов эталонов всех студентов для опознавания вне рамок одной группы.
+    Каждый процесс держит индекс в памяти. Изменения состава записываются в общий журнал
+    каталога кэша, и каждый процесс применяет новые записи журнала перед поиском.
+    Когда журнал разрастается, поколение индекса меняется и все процессы строят его заново.
+    """
+
+    def __init__(self, app=None):
+        self.index_dir = None
+        self.encoder_version = None
+        self.nlist = 0
+        self.nprobe = 16
+        self.rebuild_ratio = 0.2
+        self._index = None
+        self._generation = None
+        self._offset = 0
+        self._journal_entries = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.index_dir = os.path.join(app.config['FACE_CACHE_DIR'], 'index')
+        self.encoder_version = app.config['FACE_INDEX_ENCODER_VERSION']
+        self.nlist = app.config['FACE_INDEX_NLIST']
+        self.nprobe = app.config['FACE_INDEX_NPROBE']
+        self.rebuild_ratio = app.config['FACE_INDEX_REBUILD_RATIO']
+        os.makedirs(self.index_dir, exist_ok=True)
+        app.extensions['face_index'] = self
+
+    # ============================================
+    # Поиск
+    # ============================================
+
+    def identify(self, encodings, k=5):
+        """Возвращает для каждой кодировки k ближайших студентов в виде пар (ID студента, расстояние)."""
+        with self._lock:
+            self._sync()
+            return self._index.search(encodings, k, self.nprobe)
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._index)
+
+    # ============================================
+    # Изменение состава
+    # ============================================
+
+    def add(self, student_ids):
+        """
+        Сообщает всем процессам, что кодировки студентов добавлены или изменены.
+        Вызывается после фиксации транзакции.
+        """
+        self._append_journal('+', student_ids)
+
+    def remove(self, student_ids):
+        """Сообщает всем процессам, что студенты удалены. Вызывается после фиксации транзакции."""
+        self._append_journal('-', student_ids)
+
+    def reset(self):
+        """Перестраивает индекс во всех процессах, например после смены версии кодировщика."""
+        generation = uuid.uuid4().hex
+        path = self._generation_path()
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(generation.encode())
+        os.replace(tmp_path, path)
+        # Журналы прежних поколений больше никто не читает
+        for journal in glob.glob(os.path.join(self.index_dir, f'{glob.escape(self.encoder_version)}.*.journal')):
+            if journal != self._journal_path(generation):
+                try:
+                    os.remove(journal)
+                except OSError:
+                    pass
+
+    def _append_journal(self, op, student_ids):
+        lines = ''.join(f'{op}{int(student_id)}\n' for student_id in student_ids)
+        if not lines:
+            return
+        generation = self._read_generation()
+        while True:
+            # Одна запись в режиме O_APPEND не перемешивается с записями других процессов
+            fd = os.open(self._journal_path(generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, lines.encode())
+            finally:
+                os.close(fd)
+            # Если поколение сменилось во время записи, индекс нового поколения мог быть
+            # построен без этих изменений: запись повторяется в его журнал, а журнал
+            # старого поколения, заново созданный этой записью, удаляется
+            current = self._read_generation()
+            if current == generation:
+                return
+            try:
+                os.remove(self._journal_path(generation))
+            except OSError:
+                pass
+            generation = current
+
+    # ============================================
+    # Синхронизация с журналом
+    # ============================================
+
+    def _sync(self):
+        generation = self._read_generation()
+        if self._index is None or generation != self._generation:
+            self._index = self._build()
+            self._generation = generation
+            self._offset = 0
+            self._journal_entries = 0
+
+        try:
+            with open(self._journal_path(generation), 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Незавершённая последняя строка будет прочитана при следующей синхронизации
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return
+        self._offset += len(data)
+
+        # Для каждого студента важна только последняя операция
+        latest = {}
+        for line in data.decode().splitlines():
+            latest[int(line[1:])] = line[0]
+            self._journal_entries += 1
+        added = [student_id for student_id, op in latest.items() if op == '+']
+        self._index.remove([student_id for student_id, op in latest.items() if op == '-'])
+        ids, vectors = self._load_embeddings(added)
+        # Студенты, удалённые после записи в журнал, исчезают из индекса
+        self._index.remove(set(added) - set(ids))
+        self._index.add(ids, vectors)
+
+        if self._journal_entries > max(len(self._index) * self.rebuild_ratio, _MIN_REBUILD_ENTRIES):
+            self.reset()
+
+    def _build(self):
+        ids, vectors = self._load_embeddings()
+        return IVFIndex.build(ids, vectors, self.nlist)
+
+    def _load_embeddings(self, student_ids=None):
+        query = db.session.query(FaceEmbedding.id_student, FaceEmbedding.embedding).filter(
+            FaceEmbedding.encoder_version == self.encoder_version
+        )
+        if student_ids is not None:
+            if not student_ids:
+                return [], np.empty((0, ENCODING_SIZE), dtype=np.float32)
+            query = query.filter(FaceEmbedding.id_student.in_(student_ids))
+        rows = query.order_by(FaceEmbedding.id_student, FaceEmbedding.id).all()
+        # В индекс попадает центроид эталонов студента
+        ids, offsets, centroids, spreads = reference_centroids(
+            [student_id for student_id, embedding in rows], unpack_embeddings([e for _, e in rows])
+        )
+        return ids.tolist(), centroids
+
+    def _read_generation(self):
+        try:
+            with open(self._generation_path(), 'rb') as f:
+                return f.read().decode() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _generation_path(self):
+        return os.path.join(self.index_dir, f'{self.encoder_version}.gen')
+
+    def _journal_path(self, generation):
+        return os.path.join(self.index_dir, f'{self.encoder_version}.{generation}.journal')
+
+
+face_index = FaceIndex()
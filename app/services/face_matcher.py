@@ -0,0 +1,64 @@
+import numpy as np
+
+# Стоимость заведомо недопустимой пары лицо–студент при поиске назначения
+_REJECTED_COST = 1e6
+
+
+def distance_matrix(encodings, gallery):
+    """
+    Вычисляет матрицу евклидовых расстояний лица × галерея одним матричным умножением.
+    Использует разложение ||a - b||² = ||a||² + ||b||² - 2·a·b.
+    """
+    probes = np.asarray(encodings, dtype=np.float32).reshape(-1, gallery.encodings.shape[1])
+    probe_norms = np.einsum('ij,ij->i', probes, probes)
+    squared = probe_norms[:, None] + gallery.sq_norms[None, :] - 2.0 * (probes @ gallery.encodings.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+def reference_distances(probes, references):
+    """Возвращает матрицу расстояний probes × эталоны одного студента."""
+    differences = np.asarray(probes, dtype=np.float32)[:, None, :] - references[None, :, :]
+    return np.linalg.norm(differences, axis=2)
+
+
+def refine_distances(encodings, distances, gallery, tolerance):
+    """
+    Уточняет расстояния, неоднозначные после сравнения с центроидами.
+    По неравенству треугольника ближайший эталон студента не ближе, чем
+    (расстояние до центроида − разброс), поэтому полный набор эталонов просматривается
+    только для пар, которые не прошли порог по центроиду, но могут пройти по эталону.
+    """
+    ambiguous = (distances > tolerance) & (distances - gallery.spreads[None, :] <= tolerance)
+    probes = np.asarray(encodings, dtype=np.float32)
+    for column in np.flatnonzero(ambiguous.any(axis=0)):
+        rows = np.flatnonzero(ambiguous[:, column])
+        nearest = reference_distances(probes[rows], gallery.student_references(column)).min(axis=1)
+        distances[rows, column] = np.minimum(distances[rows, column], nearest)
+    return distances
+
+
+def match_faces(encodings, gallery, tolerance=0.6, exclude_ids=()):
+    """
+    Сопоставляет найденные лица со студентами галереи: сначала с центроидами эталонов,
+    а для неоднозначных пар — с каждым эталоном студента.
+    Решает задачу о назначениях, поэтому два лица никогда не получат одного студента.
+    Студенты из exclude_ids (уже опознанные в кадре другим способом) не назначаются.
+    Возвращает список кортежей (индекс лица, ID студента, расстояние), упорядоченный по лицам.
+    """
+    if not len(encodings) or not len(gallery):
+        return []
+    # scipy импортируется при первом сопоставлении, а не при запуске каждого процесса
+    from scipy.optimize import linear_sum_assignment
+
+    distances = refine_distances(encodings, distance_matrix(encodings, gallery), gallery, tolerance)
+    # Пары за порогом не должны влиять на назначение остальных лиц
+    costs = np.where(distances <= tolerance, distances, _REJECTED_COST)
+    if exclude_ids:
+        costs[:, np.isin(gallery.ids, list(exclude_ids))] = _REJECTED_COST
+    rows, cols = linear_sum_assignment(costs)
+    return [
+        (int(row), int(gallery.ids[col]), float(distances[row, col]))
+        for row, col in zip(rows, cols)
+        if costs[row, col] < _REJECTED_COST
+    ]
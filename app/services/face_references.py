@@ -0,0 +1,117 @@
+import threading
+import time
+
+from sqlalchemy import func
+
+from app import db
+from app.models.face_embedding import FaceEmbedding
+from app.services.embeddings import new_embedding
+from app.services.face_gallery import face_gallery
+from app.services.face_index import face_index
+from app.services.face_matcher import reference_distances
+
+
+def live_reference_candidates(gallery, matches, encodings, config):
+    """
+    Отбирает кодировки уверенно распознанных лиц, которые стоит сохранить как новые эталоны.
+    matches — кортежи (индекс кодировки, ID студента, расстояние) из match_faces.
+    Возвращает список пар (ID студента, кодировка).
+    """
+    max_references = config['FACE_REFERENCE_MAX']
+    candidates = []
+    for probe_index, student_id, distance in matches:
+        if distance > config['FACE_REFERENCE_ADD_DISTANCE']:
+            continue
+        column = gallery.column(student_id)
+        references = gallery.student_references(column)
+        if len(references) >= max_references:
+            continue
+        # Почти совпадающий с имеющимися эталон ничего не добавляет к галерее
+        encoding = encodings[probe_index]
+        if reference_distances([encoding], references).min() < config['FACE_REFERENCE_MIN_NOVELTY']:
+            continue
+        candidates.append((student_id, encoding))
+    return candidates
+
+
+class LiveReferenceBuffer:
+    """
+    Буфер живых эталонов процесса.
+    Кандидаты копятся в памяти и записываются одной транзакцией не чаще раза
+    в FACE_REFERENCE_FLUSH_INTERVAL секунд; от студента принимается не больше одного
+    кандидата за FACE_REFERENCE_STUDENT_INTERVAL секунд. Галерея каждой группы пачки
+    сбрасывается один раз, поэтому во время занятия воркеры не пересобирают её после каждого кадра.
+    Несохранённые кандидаты при остановке процесса теряются: это лишь дополнительные эталоны.
+    """
+
+    def __init__(self, app=None):
+        self.flush_interval = 60
+        self.student_interval = 300
+        self.max_references = 5
+        # (ID группы, версия кодировщика) -> {ID студента: кодировка}
+        self._pending = {}
+        self._accepted_at = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.flush_interval = app.config['FACE_REFERENCE_FLUSH_INTERVAL']
+        self.student_interval = app.config['FACE_REFERENCE_STUDENT_INTERVAL']
+        self.max_references = app.config['FACE_REFERENCE_MAX']
+        app.extensions['live_references'] = self
+
+    def add(self, gallery, candidates):
+        """
+        Принимает кандидатов из live_reference_candidates и, если подошёл срок,
+        записывает накопленную пачку. Вызывается в транзакции запроса распознавания.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = None
+            for student_id, encoding in candidates:
+                if now - self._accepted_at.get(student_id, float('-inf')) < self.student_interval:
+                    continue
+                self._accepted_at[student_id] = now
+                if pending is None:
+                    pending = self._pending.setdefault((gallery.group_id, gallery.encoder_version), {})
+                pending[student_id] = encoding
+            if not self._pending or now - self._last_flush < self.flush_interval:
+                return
+            batch, self._pending = self._pending, {}
+            self._last_flush = now
+            self._accepted_at = {student_id: accepted_at for student_id, accepted_at in self._accepted_at.items()
+                                 if now - accepted_at < self.student_interval}
+        self._save(batch)
+
+    def _save(self, batch):
+        # Число эталонов перепроверяется по базе: галерея, по которой отбирались кандидаты,
+        # могла устареть, а другие воркеры — записать свои эталоны
+        student_ids = {student_id for pending in batch.values() for student_id in pending}
+        counts = {
+            (student_id, encoder_version): count
+            for student_id, encoder_version, count in
+            db.session.query(FaceEmbedding.id_student, FaceEmbedding.encoder_version, func.count(FaceEmbedding.id))
+            .filter(FaceEmbedding.id_student.in_(student_ids))
+            .group_by(FaceEmbedding.id_student, FaceEmbedding.encoder_version)
+        }
+        added = {}
+        for (group_id, encoder_version), pending in batch.items():
+            for student_id, encoding in pending.items():
+                if counts.get((student_id, encoder_version), 0) >= self.max_references:
+                    continue
+                db.session.add(new_embedding(student_id, encoder_version, encoding, source='live'))
+                added.setdefault((group_id, encoder_version), []).append(student_id)
+        if not added:
+            return
+        db.session.commit()
+        for group_id in {group_id for group_id, encoder_version in added}:
+            face_gallery.invalidate(group_id)
+        indexed = [student_id for (group_id, encoder_version), student_ids in added.items()
+                   if encoder_version == face_index.encoder_version for student_id in student_ids]
+        if indexed:
+            face_index.add(indexed)
+
+
+live_references = LiveReferenceBuffer()
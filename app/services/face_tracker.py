@@ -0,0 +1,159 @@
+import itertools
+import threading
+import time
+
+
+def box_iou(a, b):
+    """Вычисляет IoU двух рамок в формате (top, right, bottom, left)."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    intersection = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+
+def associate_boxes(track_boxes, locations, iou_threshold):
+    """
+    Жадно сопоставляет рамки треков с рамками нового кадра по убыванию IoU.
+    Возвращает словарь {индекс лица: индекс трека}.
+    """
+    pairs = sorted(
+        ((box_iou(track_box, location), track_index, face_index)
+         for track_index, track_box in enumerate(track_boxes)
+         for face_index, location in enumerate(locations)),
+        reverse=True
+    )
+    assigned = {}
+    used_tracks = set()
+    for iou, track_index, face_index in pairs:
+        if iou < iou_threshold:
+            break
+        if face_index in assigned or track_index in used_tracks:
+            continue
+        assigned[face_index] = track_index
+        used_tracks.add(track_index)
+    return assigned
+
+
+class Track:
+    """Лицо, отслеживаемое между кадрами одной сессии распознавания."""
+
+    __slots__ = ('track_id', 'box', 'student_id', 'hits', 'misses', 'frames_since_encoding')
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.hits = 0
+        self.misses = 0
+        self.frames_since_encoding = 0
+
+
+class FaceTracker:
+    """
+    Трекер лиц одной сессии распознавания.
+    Трек подтверждается, когда одно и то же лицо несколько кадров подряд распознаётся
+    как один и тот же студент; для подтверждённых треков кодировка не вычисляется,
+    пока не придёт время плановой перепроверки.
+    """
+
+    def __init__(self, iou_threshold=0.3, confirm_hits=2, max_missed=2, reverify_frames=10):
+        self.iou_threshold = iou_threshold
+        self.confirm_hits = confirm_hits
+        self.max_missed = max_missed
+        self.reverify_frames = reverify_frames
+        self.tracks = []
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self._ids = itertools.count(1)
+
+    def is_reusable(self, track):
+        """Можно ли взять личность трека без повторного вычисления кодировки."""
+        return (track.student_id is not None
+                and track.hits >= self.confirm_hits
+                and track.frames_since_encoding < self.reverify_frames)
+
+    def confirmed_students(self, skip_tracks=()):
+        """ID студентов подтверждённых треков, кроме треков из skip_tracks."""
+        skip = {track.track_id for track in skip_tracks}
+        return {track.student_id for track in self.tracks
+                if track.student_id is not None and track.hits >= self.confirm_hits
+                and track.track_id not in skip}
+
+    def associate(self, locations):
+        """Возвращает словарь {индекс лица: трек} для рамок нового кадра."""
+        assigned = associate_boxes([track.box for track in self.tracks], locations, self.iou_threshold)
+        return self.resolve(assigned)
+
+    def resolve(self, assigned):
+        """Переводит сопоставление {индекс лица: индекс трека} в {индекс лица: трек}."""
+        return {face_index: self.tracks[track_index] for face_index, track_index in assigned.items()}
+
+    def update(self, locations, assigned, identities, encoded):
+        """
+        Обновляет треки по результатам кадра.
+        assigned — сопоставление лиц с треками, identities — {индекс лица: ID студента},
+        encoded — индексы лиц, для которых в этом кадре вычислялась кодировка.
+        """
+        self.last_used = time.monotonic()
+        matched_tracks = set()
+        for face_index, location in enumerate(locations):
+            track = assigned.get(face_index)
+            if track is None:
+                track = Track(next(self._ids), location)
+                self.tracks.append(track)
+            matched_tracks.add(track.track_id)
+            track.box = location
+            track.misses = 0
+
+            if face_index not in encoded:
+                track.frames_since_encoding += 1
+                continue
+            track.frames_since_encoding = 0
+            student_id = identities.get(face_index)
+            if student_id is not None and student_id == track.student_id:
+                track.hits += 1
+            else:
+                track.student_id = student_id
+                track.hits = 1 if student_id is not None else 0
+
+        for track in self.tracks:
+            if track.track_id not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_missed]
+
+
+class TrackerRegistry:
+    """
+    Трекеры сессий распознавания текущего процесса.
+    Ключом является пара (ID преподавателя, ID группы); неиспользуемые трекеры удаляются по TTL.
+    Если запрос попал на другой воркер, трекер там создаётся заново и лица просто кодируются повторно.
+    """
+
+    def __init__(self):
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, config):
+        """Возвращает трекер сессии, создавая его при первом обращении."""
+        now = time.monotonic()
+        ttl = config['FACE_TRACK_SESSION_TTL']
+        with self._lock:
+            for stale_key in [k for k, t in self._trackers.items() if now - t.last_used > ttl]:
+                del self._trackers[stale_key]
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = FaceTracker(
+                    iou_threshold=config['FACE_TRACK_IOU_THRESHOLD'],
+                    confirm_hits=config['FACE_TRACK_CONFIRM_HITS'],
+                    max_missed=config['FACE_TRACK_MAX_MISSED'],
+                    reverify_frames=config['FACE_TRACK_REVERIFY_FRAMES']
+                )
+                self._trackers[key] = tracker
+            return tracker
+
+
+face_trackers = TrackerRegistry()
@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from app.services.recognition import load_models, warm_up_models
+
+
+class FaceWorkersBusy(Exception):
+    """Очередь задач распознавания заполнена, запрос нужно повторить позже."""
+
+    def __init__(self, retry_after):
+        super().__init__('Очередь распознавания заполнена')
+        self.retry_after = retry_after
+
+
+class FaceJobFailed(Exception):
+    """Задача распознавания не выполнена из-за сбоя пула; запрос можно повторить."""
+
+
+class FaceJobTimeout(FaceJobFailed):
+    """Задача распознавания не уложилась в отведённое время."""
+
+
+class FaceWorkerPool:
+    """
+    Пул процессов для детекции и кодирования лиц.
+    Веб-потоки только ставят задачи и ждут результат, поэтому тяжёлые вызовы dlib
+    не блокируют остальные маршруты. Число задач в работе и в очереди ограничено:
+    при переполнении сразу выбрасывается FaceWorkersBusy.
+    Пул, процесс которого завершился аварийно или завис на задаче, пересоздаётся.
+    Фоновые задания (submit) занимают не больше background_jobs процессов,
+    поэтому распознавание кадров не получает отказ из-за добавления студентов.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 1
+        self.queue_size = 2
+        self.job_timeout = 10
+        self.retry_after = 2
+        self.start_method = None
+        self.preload = False
+        self.background_jobs = 1
+        self._executor = None
+        self._owner_pid = None
+        self._warmup = None
+        self._slots = None
+        self._background_slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config['FACE_WORKERS']
+        self.queue_size = app.config['FACE_QUEUE_SIZE']
+        self.job_timeout = app.config['FACE_JOB_TIMEOUT']
+        self.retry_after = app.config['FACE_RETRY_AFTER']
+        self.start_method = app.config.get('FACE_WORKER_START_METHOD')
+        self.preload = app.config.get('FACE_PRELOAD_MODELS', False)
+        self.background_jobs = app.config.get('FACE_BACKGROUND_JOBS') or max(1, self.workers - 1)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._background_slots = threading.BoundedSemaphore(min(self.background_jobs, self.workers + self.queue_size - 1))
+        app.extensions['face_workers'] = self
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Выполняет fn(*args) в пуле и возвращает результат.
+        Слот очереди освобождается, только когда процесс действительно закончил работу,
+        поэтому зависшие задачи тоже учитываются в ограничении очереди.
+        Задача, которая выполняется дольше таймаута, завершается вместе с процессами пула:
+        иначе зависший процесс навсегда занял бы слот. Бросает FaceJobTimeout,
+        а при аварийном завершении процесса пула — FaceJobFailed.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise FaceWorkersBusy(self.retry_after)
+        try:
+            executor, future = self._submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=timeout or self.job_timeout)
+        except TimeoutError:
+            if not future.cancel():
+                # Задача уже выполняется: отменить её можно только вместе с процессом
+                self._discard(executor, terminate=True)
+            raise FaceJobTimeout('Превышено время обработки кадра')
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise FaceJobFailed('Процесс распознавания завершился аварийно')
+
+    def submit(self, fn, *args):
+        """
+        Ставит задачу в пул, дожидаясь свободного слота очереди, и возвращает Future.
+        Используется фоновыми заданиями, которые не должны получать отказ при нагрузке.
+        Фоновых задач в пуле одновременно не больше background_jobs: остальные слоты
+        и хотя бы один процесс (при FACE_WORKERS > 1) остаются за распознаванием.
+        """
+        self._background_slots.acquire()
+        self._slots.acquire()
+        try:
+            executor, future = self._submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            self._background_slots.release()
+            raise
+
+        def release(f):
+            self._slots.release()
+            self._background_slots.release()
+            if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+                self._discard(executor)
+
+        future.add_done_callback(release)
+        return future
+
+    def _submit(self, fn, *args):
+        # Сломанный пул (процесс убит OOM или упал в dlib) заменяется новым, и задача ставится в него
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(fn, *args)
+
+    def preload_models(self):
+        """
+        Загружает и прогревает модели в текущем процессе — мастере gunicorn до запуска воркеров.
+        Процессы пула после этого создаются через fork и разделяют страницы моделей
+        с мастером (copy-on-write), а не загружают собственные копии.
+        """
+        warm_up_models()
+        self.start_method = 'fork'
+
+    def warm_up(self):
+        """
+        Запускает процессы пула и прогрев моделей в каждом из них.
+        Повторные вызовы в том же процессе возвращают те же задачи.
+        Возвращает список Future прогрева.
+        """
+        executor = self._get_executor()
+        with self._lock:
+            if self._warmup is None or self._warmup[0] is not executor:
+                # При fork все процессы пула создаются при первой задаче, пока воркер
+                # gunicorn ещё однопоточный; при forkserver/spawn — по задаче на процесс
+                self._warmup = (executor, [executor.submit(warm_up_models) for _ in range(self.workers)])
+            return self._warmup[1]
+
+    @property
+    def ready(self):
+        """Пул готов к распознаванию: прогрев во всех процессах завершился без ошибок."""
+        return all(future.done() and future.exception() is None for future in self.warm_up())
+
+    def _get_executor(self):
+        # Пул создаётся лениво в каждом процессе: после fork воркера gunicorn
+        # унаследованный от мастера пул непригоден
+        with self._lock:
+            if self._executor is None or self._owner_pid != os.getpid():
+                context = multiprocessing.get_context(self.start_method) if self.start_method else None
+                # Модели dlib загружаются один раз при старте процесса пула, а не в веб-процессе
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                     initializer=load_models)
+                self._owner_pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor, terminate=False):
+        """
+        Убирает пул executor, чтобы следующая задача создала новый.
+        terminate=True завершает его процессы: задачи, выполнявшиеся в них, получат FaceJobFailed.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._warmup = None
+        if terminate:
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._owner_pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._warmup = None
+
+
+face_workers = FaceWorkerPool()
@@ -0,0 +1,60 @@
+import os
+import threading
+
+
+class FrameSlots:
+    """
+    Слоты последних кадров сессий потокового распознавания.
+    На каждого преподавателя хранится только самый свежий кадр: новый кадр перезаписывает
+    необработанный старый, поэтому устаревшие кадры отбрасываются без обработки.
+    Слоты лежат в общем каталоге хоста, так что кадр и SSE-поток могут обслуживаться
+    разными воркерами.
+    """
+
+    def __init__(self, app=None):
+        self.frames_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.frames_dir = os.path.join(app.config['FACE_CACHE_DIR'], 'frames')
+        os.makedirs(self.frames_dir, exist_ok=True)
+        app.extensions['frame_slots'] = self
+
+    def put(self, user_id, frame_id, image_bytes):
+        """Сохраняет кадр сессии, заменяя предыдущий."""
+        path = self._path(user_id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(str(frame_id).encode() + b'\n')
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+
+    def take_newer(self, user_id, version):
+        """
+        Возвращает (версия, ID кадра, байты кадра), если в слоте есть кадр новее version,
+        иначе None. Версией служит время изменения файла слота.
+        """
+        try:
+            with open(self._path(user_id), 'rb') as f:
+                current = os.fstat(f.fileno()).st_mtime_ns
+                if current == version:
+                    return None
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        frame_id, _, image_bytes = data.partition(b'\n')
+        return current, frame_id.decode(), image_bytes
+
+    def clear(self, user_id):
+        """Удаляет кадр сессии при открытии и завершении SSE-потока."""
+        try:
+            os.remove(self._path(user_id))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, user_id):
+        return os.path.join(self.frames_dir, f'user_{int(user_id)}.frame')
+
+
+frame_slots = FrameSlots()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import uuid
+
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+
+from app import db
+from app.models.role import Role
+from app.models.user import User
+
+
+class Identity:
+    """
+    Снимок данных текущего пользователя, нужных представлениям и шаблонам.
+    Не связан с сессией SQLAlchemy, поэтому может переживать запрос в кэше процесса.
+    Для изменения пользователя представление загружает модель User явно.
+    """
+    __slots__ = ('id', 'fio', 'login', 'mail', 'role', 'first_start')
+
+    def __init__(self, id, fio, login, mail, role, first_start):
+        self.id = id
+        self.fio = fio
+        self.login = login
+        self.mail = mail
+        self.role = role
+        self.first_start = first_start
+
+
+class IdentityCache:
+    """
+    Кэш пользователей по ID с коротким временем жизни записей.
+    Пользователь загружается из базы не чаще раза за IDENTITY_CACHE_TTL секунд на процесс
+    и не более одного раза за запрос (снимок хранится в g).
+    Удаление пользователя или смена пароля меняют поколение кэша в файле общего каталога,
+    после чего каждый процесс хоста перечитывает пользователей.
+    """
+
+    def __init__(self, app=None):
+        self.cache_dir = None
+        self.ttl = 30
+        self._entries = {}
+        self._generation = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache_dir = os.path.join(app.config['FACE_CACHE_DIR'], 'identities')
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 30)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        app.extensions['identity_cache'] = self
+
+    def get(self, user_id):
+        """Возвращает Identity пользователя или None, если пользователя нет."""
+        generation = self._read_generation()
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        row = (db.session.query(User.id, User.fio, User.login, User.mail, Role.rolename, User.first_start)
+               .join(Role, User.id_role == Role.id)
+               .filter(User.id == user_id)
+               .first())
+        identity = Identity(*row) if row else None
+        # Отсутствующий пользователь тоже кэшируется: токен удалённого пользователя не должен
+        # приводить к запросу в базу на каждом обращении
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, identity)
+        return identity
+
+    def invalidate(self):
+        """Сбрасывает кэш пользователей во всех процессах хоста. Вызывается после фиксации изменений."""
+        path = self._generation_path()
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(uuid.uuid4().hex.encode())
+        os.replace(tmp_path, path)
+
+    def _read_generation(self):
+        try:
+            with open(self._generation_path(), 'rb') as f:
+                return f.read().decode() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _generation_path(self):
+        return os.path.join(self.cache_dir, 'generation')
+
+
+identity_cache = IdentityCache()
+
+
+def current_identity():
+    """
+    Возвращает Identity пользователя текущего запроса (по JWT) или None.
+    Пользователь определяется один раз за запрос; вызывать после проверки JWT.
+    """
+    if 'identity' not in g:
+        user_id = get_jwt_identity()
+        g.identity = identity_cache.get(int(user_id)) if user_id is not None else None
+    return g.identity
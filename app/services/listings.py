@@ -0,0 +1,110 @@
+from app import db
+from app.models.group import Group
+from app.models.lesson import Lesson
+from app.models.role import Role
+from app.models.student import Student
+from app.models.teacher import Teacher
+from app.models.user import User
+from app.services.pagination import keyset_page, page_params, prefix_filter
+
+# Порядок строк списков: последний столбец делает его однозначным для курсора страницы
+STUDENT_ORDER = (Student.fio, Student.id)
+USER_ORDER = (User.fio, User.id)
+TEACHER_SUBJECT_ORDER = (Teacher.id,)
+
+
+def listing(query, order_columns, serialize, args):
+    """
+    Отдаёт строки списка целиком или страницей, если клиент передал limit/after.
+    Возвращает кортеж (элементы, сведения о странице или None):
+    сведения содержат next_cursor и total (при total=1).
+    Бросает InvalidPageRequest при некорректных параметрах страницы.
+    """
+    params = page_params(args)
+    if params is None:
+        return [serialize(row) for row in query.order_by(*order_columns)], None
+    after, limit, with_total = params
+    rows, next_cursor, total = keyset_page(
+        query, order_columns, lambda row: [getattr(row, column.key) for column in order_columns],
+        after, limit, with_total
+    )
+    return [serialize(row) for row in rows], {'next_cursor': next_cursor, 'total': total}
+
+
+# ============================================
+# Студенты
+# ============================================
+
+def student_rows(group_id=None, fio=None, mail=None):
+    """Студенты с названием группы одним запросом; fio и mail — начала ФИО и почты."""
+    query = db.session.query(
+        Student.id, Student.fio, Student.mail, Student.birth_date, Student.education_form,
+        Group.groupname
+    ).join(Group, Student.id_group == Group.id)
+    if group_id:
+        query = query.filter(Student.id_group == group_id)
+    if fio:
+        query = query.filter(prefix_filter(Student.fio, fio))
+    if mail:
+        query = query.filter(prefix_filter(Student.mail, mail))
+    return query
+
+
+def student_to_dict(row):
+    return {
+        'id': row.id,
+        'student_id_display': f"{'Б' if row.education_form == 'бюджетная' else 'В'}{str(row.id)[:2]}-{str(row.id)[2:]}",
+        'fio': row.fio,
+        'group': row.groupname,
+        'mail': row.mail,
+        'birth_date': row.birth_date.strftime('%Y-%m-%d')
+    }
+
+
+# ============================================
+# Пользователи
+# ============================================
+
+def user_rows(fio=None, mail=None, role=None):
+    """Пользователи с названием роли одним запросом; fio и mail — начала ФИО и почты."""
+    query = db.session.query(
+        User.id, User.fio, User.login, User.mail, User.birth_date, Role.rolename
+    ).join(Role, User.id_role == Role.id)
+    if fio:
+        query = query.filter(prefix_filter(User.fio, fio))
+    if mail:
+        query = query.filter(prefix_filter(User.mail, mail))
+    if role:
+        query = query.filter(Role.rolename == role)
+    return query
+
+
+def user_to_dict(row):
+    return {
+        'id': row.id,
+        'fio': row.fio,
+        'login': row.login,
+        'role': row.rolename,
+        'mail': row.mail,
+        'birth_date': row.birth_date.strftime('%Y-%m-%d') if row.birth_date else None
+    }
+
+
+# ============================================
+# Связи преподавателей и предметов
+# ============================================
+
+def teacher_subject_rows(fio=None, lesson=None):
+    """Связи преподаватель–предмет с ФИО и названием предмета одним запросом."""
+    query = db.session.query(Teacher.id, User.fio, Lesson.lesson).join(
+        User, Teacher.id_user == User.id
+    ).join(Lesson, Teacher.id_lesson == Lesson.id)
+    if fio:
+        query = query.filter(prefix_filter(User.fio, fio))
+    if lesson:
+        query = query.filter(prefix_filter(Lesson.lesson, lesson))
+    return query
+
+
+def teacher_subject_to_dict(row):
+    return {'id': row.id, 'user': row.fio, 'lesson': row.lesson}
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+
+from app import db
+
+
+class LookupCache:
+    """
+    Кэш ответов справочных API фильтров (преподаватели, предметы, группы и их связи).
+    Ответы хранятся в памяти процесса и помечаются версией справочных данных.
+    Версия лежит в файле общего каталога хоста, поэтому изменение справочников
+    в одном воркере gunicorn сбрасывает кэш во всех. Пока версия не изменилась,
+    ответ отдаётся без обращения к базе данных, а браузер с тем же ETag получает 304.
+    """
+
+    def __init__(self, app=None):
+        self.cache_dir = None
+        self.max_entries = 512
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache_dir = os.path.join(app.config['FACE_CACHE_DIR'], 'lookups')
+        self.max_entries = app.config.get('LOOKUP_CACHE_MAX_ENTRIES', 512)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        app.extensions['lookup_cache'] = self
+
+    # ============================================
+    # Версия справочных данных
+    # ============================================
+
+    def invalidate(self):
+        """
+        Отмечает, что текущая транзакция меняет справочные данные.
+        Версия меняется только после фиксации транзакции: иначе параллельный запрос
+        мог бы закэшировать ещё не изменённые данные под новой версией.
+        """
+        db.session.info['lookups_changed'] = True
+
+    def bump(self):
+        """Немедленно меняет версию справочных данных во всех процессах хоста."""
+        path = self._version_path()
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(uuid.uuid4().hex.encode())
+        os.replace(tmp_path, path)
+
+    def version(self):
+        try:
+            with open(self._version_path(), 'rb') as f:
+                return f.read().decode() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _version_path(self):
+        return os.path.join(self.cache_dir, 'version')
+
+    # ============================================
+    # Кэширование ответов
+    # ============================================
+
+    def cached(self, per_user=False):
+        """
+        Декоратор GET-представления, возвращающего JSON.
+        Ключ кэша — путь и параметры запроса, а с per_user=True ещё и ID пользователя
+        (для ответов, зависящих от текущего преподавателя).
+        """
+
+        def wrapper(f):
+            @wraps(f)
+            def decorated_view(*args, **kwargs):
+                # Версия читается до запроса к базе: данные, изменённые во время
+                # построения ответа, попадут в кэш под устаревшей версией и не будут отданы
+                version = self.version()
+                key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                       get_jwt_identity() if per_user else None)
+                etag = hashlib.sha1(repr((version, key)).encode()).hexdigest()
+
+                if etag in request.if_none_match:
+                    return self._response(b'', etag, 304)
+
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry and entry[0] == etag:
+                        self._entries.move_to_end(key)
+                        return self._response(entry[1], etag)
+
+                response = f(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+                body = response.get_data()
+                with self._lock:
+                    self._entries[key] = (etag, body)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return self._response(body, etag)
+
+            return decorated_view
+
+        return wrapper
+
+    @staticmethod
+    def _response(body, etag, status=200):
+        response = Response(body, status=status, mimetype='application/json')
+        response.set_etag(etag)
+        # Браузер хранит ответ, но перед использованием сверяет ETag с сервером
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+lookup_cache = LookupCache()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_after_commit(session):
+    if session.info.pop('lookups_changed', False):
+        lookup_cache.bump()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_on_rollback(session, previous_transaction):
+    session.info.pop('lookups_changed', None)
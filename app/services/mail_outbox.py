@@ -0,0 +1,242 @@
+import random
+import smtplib
+import ssl
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytz
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.email_outbox import EmailOutbox
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+
+# Сколько секунд письмо, взятое рассыльщиком, недоступно другим рассыльщикам.
+# Если рассыльщик упал, не дойдя до отметки об отправке, письмо будет взято снова
+CLAIM_LEASE = 600
+
+
+# ============================================
+# Постановка писем в очередь
+# ============================================
+
+def queue_email(recipient, subject, body_text, body_html=None):
+    """
+    Добавляет письмо в outbox в текущей транзакции.
+    Письмо будет отправлено рассыльщиком только после фиксации транзакции.
+    """
+    now = datetime.now(moscow_tz)
+    email = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body_text=body_text,
+        body_html=body_html,
+        status='pending',
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now
+    )
+    db.session.add(email)
+    return email
+
+
+def absence_email(student_fio, subject_name, teacher_fio):
+    """Возвращает тему, текст и HTML письма студенту об отсутствии на занятии."""
+    text = (f"Уважаемый(ая) {student_fio},\n\n"
+            f"Вы отсутствовали на занятии по предмету {subject_name} у преподавателя {teacher_fio}.\n"
+            "Просьба предоставить документ, подтверждающий уважительную причину пропуска занятия.\n\n"
+            "С уважением,\nВаше учебное заведение.")
+    html = f"""\
+    <html>
+      <body>
+        <p>Уважаемый(ая) {student_fio},<br><br>
+           Вы отсутствовали на занятии по предмету <strong>{subject_name}</strong> у преподавателя <strong>{teacher_fio}</strong>.<br>
+           Просьба предоставить документ, подтверждающий уважительную причину пропуска занятия.<br><br>
+           С уважением,<br>
+           Ваше учебное заведение.
+        </p>
+      </body>
+    </html>
+    """
+    return "Отсутствие на занятии", text, html
+
+
+def absence_dedup_key(session_key, student_id):
+    """Ключ письма об отсутствии студента на конкретном занятии."""
+    return f'absence:{session_key}:{student_id}'
+
+
+def queue_absence_emails(students, subject_name, teacher_fio, session_key=None, present_ids=()):
+    """
+    Ставит в очередь письма об отсутствии одним пакетным INSERT в текущей транзакции.
+    students — строки с полями id, fio и mail. С session_key повторная отправка занятия
+    не дублирует письма, а ещё не отправленные письма студентам из present_ids отменяются.
+    """
+    if session_key and present_ids:
+        (EmailOutbox.query
+         .filter(EmailOutbox.dedup_key.in_([absence_dedup_key(session_key, i) for i in present_ids]),
+                 EmailOutbox.status == 'pending')
+         .delete(synchronize_session=False))
+
+    now = datetime.now(moscow_tz)
+    rows = []
+    for student in students:
+        if not student.mail:
+            continue
+        subject, text, html = absence_email(student.fio, subject_name, teacher_fio)
+        rows.append({
+            'recipient': student.mail, 'subject': subject, 'body_text': text, 'body_html': html,
+            'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now,
+            'dedup_key': absence_dedup_key(session_key, student.id) if session_key else None,
+        })
+    if rows:
+        db.session.execute(insert(EmailOutbox).values(rows).on_conflict_do_nothing(index_elements=['dedup_key']))
+
+
+# ============================================
+# Рассылка
+# ============================================
+
+class SmtpConnection:
+    """
+    Одно SMTP-подключение с авторизацией, переиспользуемое для всех писем рассыльщика.
+    При разрыве соединения сервером подключение восстанавливается при следующей отправке.
+    """
+
+    def __init__(self, config):
+        self.host = config.get("MAIL_HOST")
+        self.port = config.get("MAIL_PORT")
+        self.username = config.get("MAIL_USERNAME")
+        self.password = config.get("MAIL_PASSWORD")
+        self.use_ssl = config.get("MAIL_USE_SSL", True)
+        self.use_starttls = config.get("MAIL_USE_STARTTLS", False)
+        self.timeout = config.get("MAIL_TIMEOUT", 30)
+        self._server = None
+
+    def send(self, mail_from, recipient, message):
+        try:
+            self._connect().sendmail(mail_from, recipient, message)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл простаивавшее соединение: одна повторная попытка с новым подключением
+            self._server = None
+            self._connect().sendmail(mail_from, recipient, message)
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _connect(self):
+        if self._server is None:
+            context = ssl.create_default_context()
+            if self.use_ssl:
+                server = smtplib.SMTP_SSL(self.host, self.port, context=context, timeout=self.timeout)
+            else:
+                server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.use_starttls:
+                    server.starttls(context=context)
+            if self.username:
+                server.login(self.username, self.password)
+            self._server = server
+        return self._server
+
+
+class OutboxDispatcher:
+    """
+    Рассыльщик писем из outbox.
+    Берёт пачку готовых к отправке писем (SKIP LOCKED позволяет запускать несколько
+    рассыльщиков), отправляет их через одно SMTP-подключение не быстрее MAIL_RATE_LIMIT
+    писем в секунду, неудачные попытки откладывает с экспоненциально растущей задержкой.
+    """
+
+    def __init__(self, config):
+        self.mail_from = config.get("MAIL_FROM")
+        self.batch_size = config.get("MAIL_BATCH_SIZE", 50)
+        self.rate_limit = config.get("MAIL_RATE_LIMIT", 5)
+        self.max_attempts = config.get("MAIL_MAX_ATTEMPTS", 5)
+        self.retry_base_delay = config.get("MAIL_RETRY_BASE_DELAY", 30)
+        self.retry_max_delay = config.get("MAIL_RETRY_MAX_DELAY", 3600)
+        self.connection = SmtpConnection(config)
+        self._last_sent = 0.0
+
+    def dispatch_batch(self):
+        """Отправляет одну пачку писем. Возвращает словарь с числом отправленных, отложенных и отклонённых."""
+        stats = {'sent': 0, 'retry': 0, 'failed': 0}
+        for email_id in self._claim():
+            email = db.session.get(EmailOutbox, email_id)
+            self._throttle()
+            try:
+                self.connection.send(self.mail_from, email.recipient, self._build_message(email))
+            except smtplib.SMTPRecipientsRefused as e:
+                # Адрес отклонён сервером: повторная отправка не поможет
+                self._mark_failed(email, e, permanent=True)
+                stats['failed'] += 1
+            except (smtplib.SMTPException, OSError) as e:
+                self.connection.close()
+                if self._mark_failed(email, e):
+                    stats['failed'] += 1
+                else:
+                    stats['retry'] += 1
+            else:
+                email.status = 'sent'
+                email.sent_at = datetime.now(moscow_tz)
+                email.last_error = None
+                stats['sent'] += 1
+            # Статус фиксируется сразу, чтобы после сбоя рассыльщика письмо не ушло повторно
+            db.session.commit()
+        return stats
+
+    def close(self):
+        self.connection.close()
+
+    def _claim(self):
+        now = datetime.now(moscow_tz)
+        emails = (EmailOutbox.query
+                  .filter(EmailOutbox.status.in_(('pending', 'sending')), EmailOutbox.next_attempt_at <= now)
+                  .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                  .limit(self.batch_size)
+                  .with_for_update(skip_locked=True)
+                  .all())
+        for email in emails:
+            email.status = 'sending'
+            email.next_attempt_at = now + timedelta(seconds=CLAIM_LEASE)
+        email_ids = [email.id for email in emails]
+        db.session.commit()
+        return email_ids
+
+    def _mark_failed(self, email, error, permanent=False):
+        """Откладывает письмо или помечает его как failed. Возвращает True, если попытки исчерпаны."""
+        email.attempts += 1
+        email.last_error = str(error)
+        if permanent or email.attempts >= self.max_attempts:
+            email.status = 'failed'
+            return True
+        delay = min(self.retry_base_delay * 2 ** (email.attempts - 1), self.retry_max_delay)
+        # Случайная добавка разводит повторные попытки писем, упавших одновременно
+        delay *= 1 + random.uniform(0, 0.1)
+        email.status = 'pending'
+        email.next_attempt_at = datetime.now(moscow_tz) + timedelta(seconds=delay)
+        return False
+
+    def _throttle(self):
+        if self.rate_limit > 0:
+            wait = self._last_sent + 1.0 / self.rate_limit - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_sent = time.monotonic()
+
+    def _build_message(self, email):
+        message = MIMEMultipart("alternative")
+        message["Subject"] = email.subject
+        message["From"] = self.mail_from
+        message["To"] = email.recipient
+        message.attach(MIMEText(email.body_text, "plain"))
+        if email.body_html:
+            message.attach(MIMEText(email.body_html, "html"))
+        return message.as_string()
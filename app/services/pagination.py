@@ -0,0 +1,66 @@
+import base64
+import json
+
+from sqlalchemy import func, tuple_
+
+# Размер страницы списков по умолчанию и максимальный размер, который может запросить клиент
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidPageRequest(ValueError):
+    """Некорректные параметры страницы (limit или курсор after)."""
+
+
+def page_params(args):
+    """
+    Разбирает параметры страницы из запроса: limit, after (курсор) и total=1.
+    Возвращает None, если клиент не запрашивал постраничный вывод, иначе кортеж (after, limit, with_total).
+    """
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest('Некорректный размер страницы')
+    if limit < 1:
+        raise InvalidPageRequest('Некорректный размер страницы')
+    with_total = args.get('total', '').lower() in ('1', 'true')
+    return args.get('after') or None, min(limit, MAX_PAGE_SIZE), with_total
+
+
+def prefix_filter(column, prefix):
+    """Условие «значение начинается с prefix» без учёта регистра; спецсимволы LIKE экранируются."""
+    escaped = prefix.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return func.lower(column).like(f'{escaped}%', escape='\\')
+
+
+def keyset_page(query, order_columns, key, after=None, limit=DEFAULT_PAGE_SIZE, with_total=False):
+    """
+    Возвращает страницу query после курсора after при сортировке по order_columns.
+    order_columns должны однозначно упорядочивать строки (последний столбец — ID),
+    key(row) возвращает значения этих столбцов для строки.
+    В отличие от OFFSET, следующая страница находится по индексу сравнением
+    (столбцы) > (значения последней строки), поэтому её стоимость не растёт с номером страницы.
+    Возвращает кортеж (строки, курсор следующей страницы или None, общее число строк или None).
+    """
+    total = query.order_by(None).count() if with_total else None
+    if after:
+        query = query.filter(tuple_(*order_columns) > tuple_(*decode_cursor(after, len(order_columns))))
+    rows = query.order_by(*order_columns).limit(limit + 1).all()
+    next_cursor = encode_cursor(key(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor, total
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values), ensure_ascii=False).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidPageRequest('Некорректный курсор страницы')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidPageRequest('Некорректный курсор страницы')
+    return values
@@ -0,0 +1,131 @@
+import io
+
+from app.services.face_tracker import associate_boxes
+
+# cv2 и face_recognition (вместе с моделями dlib) импортируются при первом вызове:
+# веб-процессы и CLI-команды, которые не распознают лица, не тратят на них время запуска
+
+# Сторона пустого кадра для прогрева моделей, в пикселях
+WARMUP_FRAME_SIZE = 160
+
+
+def load_models():
+    """
+    Импортирует библиотеки распознавания и загружает модели dlib.
+    Вызывается при старте процесса пула, чтобы первый кадр не ждал загрузки моделей.
+    """
+    import cv2
+    import face_recognition
+
+
+def warm_up_models():
+    """
+    Прогревает модели пустым кадром: детектор HOG, оба предиктора ключевых точек и ResNet.
+    Первая реальная задача после этого не платит за ленивые выделения памяти dlib.
+    """
+    import numpy as np
+    frame = np.zeros((WARMUP_FRAME_SIZE, WARMUP_FRAME_SIZE, 3), dtype=np.uint8)
+    detect_faces(frame)
+    box = (WARMUP_FRAME_SIZE // 4, WARMUP_FRAME_SIZE * 3 // 4, WARMUP_FRAME_SIZE * 3 // 4, WARMUP_FRAME_SIZE // 4)
+    for model in ('small', 'large'):
+        encode_faces(frame, [box], model=model)
+    return True
+
+
+def detection_settings(config):
+    """Собирает параметры детектора лиц из конфигурации приложения."""
+    return {
+        'scale': config['FACE_DETECTION_SCALE'],
+        'upsample': config['FACE_DETECTION_UPSAMPLE'],
+        'min_face_size': config['FACE_MIN_SIZE'],
+        'model': config['FACE_DETECTION_MODEL'],
+    }
+
+
+def decode_frame(image_bytes):
+    """Декодирует JPEG/WebP-кадр в RGB-массив. Возвращает None, если кадр повреждён."""
+    import cv2
+    import numpy as np
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def detect_faces(rgb_frame, scale=1.0, upsample=1, min_face_size=0, model='hog'):
+    """
+    Находит лица на уменьшенной копии кадра и переводит рамки в координаты исходного кадра.
+    Рамки меньше min_face_size пикселей по любой стороне отбрасываются.
+    Возвращает список (top, right, bottom, left).
+    """
+    import cv2
+    import face_recognition
+    height, width = rgb_frame.shape[:2]
+    if 0 < scale < 1:
+        small_frame = cv2.resize(rgb_frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        scale = 1.0
+        small_frame = rgb_frame
+
+    locations = []
+    for top, right, bottom, left in face_recognition.face_locations(
+            small_frame, number_of_times_to_upsample=upsample, model=model):
+        top = max(int(round(top / scale)), 0)
+        right = min(int(round(right / scale)), width)
+        bottom = min(int(round(bottom / scale)), height)
+        left = max(int(round(left / scale)), 0)
+        if bottom - top < min_face_size or right - left < min_face_size:
+            continue
+        locations.append((top, right, bottom, left))
+    return locations
+
+
+def encode_faces(rgb_frame, locations, num_jitters=1, model='small'):
+    """
+    Вычисляет кодировки лиц по рамкам на кадре в исходном разрешении.
+    num_jitters и model задаются версией кодировщика галереи.
+    """
+    if not locations:
+        return []
+    import face_recognition
+    return face_recognition.face_encodings(rgb_frame, locations, num_jitters=num_jitters, model=model)
+
+
+# ============================================
+# Задачи для пула процессов распознавания
+# ============================================
+
+def analyze_frame(image_bytes, settings, encoder, track_boxes=(), reusable=(), iou_threshold=0.3):
+    """
+    Полная обработка кадра в процессе пула: декодирование, детекция и кодирование.
+    Лица, сопоставленные с треками из reusable, не кодируются; encoder — параметры
+    версии кодировщика, которой построена галерея.
+    Возвращает None, если кадр не удалось декодировать, иначе словарь с рамками,
+    сопоставлением {индекс лица: индекс трека} и кодировками {индекс лица: кодировка}.
+    """
+    rgb_frame = decode_frame(image_bytes)
+    if rgb_frame is None:
+        return None
+    locations = detect_faces(rgb_frame, **settings)
+    assigned = associate_boxes(track_boxes, locations, iou_threshold)
+    to_encode = [i for i in range(len(locations)) if i not in assigned or not reusable[assigned[i]]]
+    encodings = encode_faces(rgb_frame, [locations[i] for i in to_encode], **encoder)
+    return {
+        'locations': locations,
+        'assigned': assigned,
+        'encodings': dict(zip(to_encode, encodings)),
+    }
+
+
+def encode_image_bytes(data, encoder=None):
+    """Декодирует фотографию из байтов и возвращает кодировки всех найденных на ней лиц."""
+    import face_recognition
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    return face_recognition.face_encodings(image, **(encoder or {}))
+
+
+def encode_image_file(path, encoder=None):
+    """Загружает фотографию и возвращает кодировки всех найденных на ней лиц."""
+    import face_recognition
+    image = face_recognition.load_image_file(path)
+    return face_recognition.face_encodings(image, **(encoder or {}))
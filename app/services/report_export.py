@@ -0,0 +1,102 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+
+from app.services.reports import EXPORT_LAYOUTS, REPORT_DATE_FORMAT, export_rows, parse_report_date
+
+# Сколько строк CSV накапливается перед отправкой клиенту
+CSV_FLUSH_ROWS = 500
+
+CSV_MIMETYPE = 'text/csv; charset=utf-8'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class ExportUnavailable(Exception):
+    """Формат выгрузки недоступен на сервере (не установлена нужная библиотека)."""
+
+
+def export_response(export_format, layout, teacher_user_id=None, lesson_id=None, group_id=None,
+                    date_from=None, date_to=None):
+    """
+    Возвращает ответ с выгрузкой посещаемости в CSV или XLSX.
+    CSV передаётся потоком по мере чтения строк из базы. XLSX не потоковый: книга целиком
+    записывается во временный файл до начала ответа (оглавление zip-архива пишется в конце),
+    и только затем файл отдаётся частями; память при этом от размера выгрузки не зависит.
+    Фильтры проверяются до начала передачи: ошибку в середине потока клиенту уже не сообщить.
+    Бросает ValueError при неверных параметрах и ExportUnavailable, если формат недоступен.
+    """
+    if export_format not in ('csv', 'xlsx'):
+        raise ValueError('Неизвестный формат выгрузки')
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError('Неизвестный вид выгрузки')
+    try:
+        parse_report_date(date_from)
+        parse_report_date(date_to)
+    except ValueError:
+        raise ValueError('Некорректная дата: ожидается ГГГГ-ММ-ДД')
+
+    rows = export_rows(layout, teacher_user_id, lesson_id, group_id, date_from, date_to)
+    filename = f"attendance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if export_format == 'csv':
+        response = Response(stream_with_context(csv_chunks(rows)), mimetype=CSV_MIMETYPE)
+    else:
+        response = Response(file_chunks(xlsx_file(rows)), mimetype=XLSX_MIMETYPE)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def csv_chunks(rows):
+    """
+    Генератор частей CSV-файла из строк выгрузки.
+    Разделитель — «;», в начале файла BOM: так файл корректно открывается в Excel с русской локалью.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    for number, row in enumerate(rows, 1):
+        writer.writerow([value.strftime(REPORT_DATE_FORMAT) if isinstance(value, date) else value
+                         for value in row])
+        if number % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_file(rows):
+    """
+    Записывает строки выгрузки в XLSX-книгу в режиме write_only и возвращает путь к временному файлу.
+    Строки сразу сбрасываются на диск, поэтому память не зависит от размера выгрузки.
+    Файл удаляет вызывающий код.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportUnavailable('Выгрузка в XLSX недоступна: не установлен openpyxl')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Посещаемость')
+    for row in rows:
+        sheet.append(row)
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def file_chunks(path, chunk_size=64 * 1024):
+    """Генератор частей файла; после отправки файл удаляется."""
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        os.remove(path)
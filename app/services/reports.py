@@ -0,0 +1,346 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+import pytz
+from sqlalchemy import any_, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models.attendance import Attendance
+from app.models.attendance_rollup import AttendanceRollup
+from app.models.group import Group
+from app.models.lesson import Lesson
+from app.models.student import Student
+from app.models.teacher import Teacher
+from app.models.user import User
+from app.services.lookup_cache import lookup_cache
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+
+# Формат дат в отчётах о посещаемости
+REPORT_DATE_FORMAT = "%d.%m.%Y"
+
+
+def parse_report_date(value):
+    """Преобразует дату фильтра ГГГГ-ММ-ДД в date; пустое значение — None."""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def day_bounds(first_day, last_day):
+    """Возвращает полуинтервал [начало first_day, начало дня после last_day) по московскому времени."""
+    start = moscow_tz.localize(datetime.combine(first_day, time()))
+    end = moscow_tz.localize(datetime.combine(last_day + timedelta(days=1), time()))
+    return start, end
+
+
+def timestamp_range(column, first_day=None, last_day=None):
+    """
+    Условия отбора отметок за дни first_day..last_day по московскому времени.
+    Фильтр строится как полуинтервал по самому столбцу, а не как date(column) = ...,
+    поэтому запрос использует индексы (id_group, timestamp) и (id_teacher, timestamp).
+    Не заданная граница не ограничивает период.
+    """
+    conditions = []
+    if first_day:
+        conditions.append(column >= day_bounds(first_day, first_day)[0])
+    if last_day:
+        conditions.append(column < day_bounds(last_day, last_day)[1])
+    return conditions
+
+
+# ============================================
+# Сводные таблицы посещаемости
+# ============================================
+
+def _rollup_rows(filters):
+    """SELECT сводных строк из сырых отметок посещаемости, удовлетворяющих filters."""
+    day = func.date(func.timezone('Europe/Moscow', Attendance.timestamp))
+    students = func.array_agg(Attendance.id_student.distinct()).filter(Attendance.id_student.isnot(None))
+    return db.session.query(
+        Attendance.id_group,
+        Attendance.id_teacher,
+        day.label('day'),
+        func.count(Attendance.id_student.distinct()),
+        func.coalesce(students, literal_column("'{}'::integer[]"))
+    ).filter(*filters).group_by(Attendance.id_group, Attendance.id_teacher, day)
+
+
+def _upsert_rollups(select):
+    statement = insert(AttendanceRollup).from_select(
+        ['id_group', 'id_teacher', 'day', 'present_count', 'present_students'], select
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['id_group', 'id_teacher', 'day'],
+        set_={'present_count': statement.excluded.present_count,
+              'present_students': statement.excluded.present_students}
+    )
+    return db.session.execute(statement).rowcount
+
+
+def refresh_rollup(group_id, teacher_id, day):
+    """
+    Пересчитывает сводку группы и записи преподавателя за один день.
+    Вызывается в транзакции записи или удаления отметок, поэтому сводка фиксируется вместе с ними;
+    сводка дня без отметок удаляется.
+    """
+    # Параллельные отметки одного занятия пересчитывают сводку по очереди,
+    # иначе каждая транзакция записала бы сводку без строк другой
+    db.session.execute(db.text("SELECT pg_advisory_xact_lock(:group_id, :teacher_id)"),
+                       {'group_id': group_id, 'teacher_id': teacher_id})
+    # Первое занятие преподавателя с группой меняет списки фильтров дашбордов
+    if not db.session.query(AttendanceRollup.query.filter(
+            AttendanceRollup.id_group == group_id, AttendanceRollup.id_teacher == teacher_id
+    ).exists()).scalar():
+        lookup_cache.invalidate()
+    written = _upsert_rollups(_rollup_rows([
+        Attendance.id_group == group_id,
+        Attendance.id_teacher == teacher_id,
+        *timestamp_range(Attendance.timestamp, day, day)
+    ]).statement)
+    # Отметок за день не осталось (например, удалён единственный отмеченный студент)
+    if not written:
+        AttendanceRollup.query.filter(
+            AttendanceRollup.id_group == group_id,
+            AttendanceRollup.id_teacher == teacher_id,
+            AttendanceRollup.day == day
+        ).delete(synchronize_session=False)
+
+
+def student_rollup_keys(student_id):
+    """Ключи сводок (группа, запись преподавателя, день), в которые входят отметки студента."""
+    day = func.date(func.timezone('Europe/Moscow', Attendance.timestamp))
+    return db.session.query(Attendance.id_group, Attendance.id_teacher, day).filter(
+        Attendance.id_student == student_id
+    ).distinct().all()
+
+
+def rebuild_rollups(date_from=None, date_to=None):
+    """
+    Перестраивает сводки за период (по умолчанию — за всё время) из сырых отметок.
+    Возвращает число записанных сводных строк.
+    """
+    rollups = AttendanceRollup.query
+    if date_from:
+        rollups = rollups.filter(AttendanceRollup.day >= date_from)
+    if date_to:
+        rollups = rollups.filter(AttendanceRollup.day <= date_to)
+    rollups.delete(synchronize_session=False)
+    _upsert_rollups(_rollup_rows(timestamp_range(Attendance.timestamp, date_from, date_to)).statement)
+    lookup_cache.invalidate()
+    return rollups.count()
+
+
+def present_student_ids(group_id, day, teacher_ids=None):
+    """Возвращает множество ID студентов группы, отмеченных в указанный день."""
+    query = db.session.query(AttendanceRollup.present_students).filter(
+        AttendanceRollup.id_group == group_id, AttendanceRollup.day == day
+    )
+    if teacher_ids is not None:
+        query = query.filter(AttendanceRollup.id_teacher.in_(teacher_ids))
+    return {student_id for (students,) in query for student_id in students}
+
+
+# ============================================
+# Отчёты
+# ============================================
+
+def attendance_report(teacher_user_id=None, lesson_id=None, group_id=None, date_from=None, date_to=None):
+    """
+    Строит матрицу посещаемости «студент × дата занятия» для каждой тройки
+    (преподаватель, предмет, группа) с учётом фильтров. date_from и date_to — строки ГГГГ-ММ-ДД.
+    Читает сводные таблицы, поэтому стоимость отчёта зависит от числа дней занятий в нём,
+    а не от объёма сырых отметок; составы всех затронутых групп загружаются одним запросом.
+    Возвращает список блоков отчёта в формате attendance_by_group дашбордов.
+    """
+    rows = _report_query(teacher_user_id, lesson_id, group_id, date_from, date_to).all()
+    if not rows:
+        return []
+
+    # Блок отчёта: дни всех занятий и дни присутствия каждого отмеченного студента
+    blocks = {}
+    for row in rows:
+        block = blocks.setdefault((row.teacher_id, row.group_id), {
+            'teacher_fio': row.teacher_fio,
+            'lesson_name': row.lesson_name,
+            'group_id': row.group_id,
+            'groupname': row.groupname,
+            'days': set(),
+            'present': defaultdict(set)
+        })
+        block['days'].add(row.day)
+        for student_id in row.present_students:
+            block['present'][student_id].add(row.day)
+
+    group_ids = {block['group_id'] for block in blocks.values()}
+    attended_ids = {student_id for block in blocks.values() for student_id in block['present']}
+    rosters = defaultdict(list)
+    names = {}
+    for student in db.session.query(Student.id, Student.fio, Student.id_group).filter(
+            Student.id_group.in_(group_ids) | Student.id.in_(attended_ids)
+    ).order_by(Student.fio):
+        names[student.id] = student.fio
+        if student.id_group in group_ids:
+            rosters[student.id_group].append(student.id)
+
+    report = []
+    for block in blocks.values():
+        days = sorted(block['days'])
+        roster = rosters[block['group_id']]
+        # Отмеченные студенты, покинувшие группу, тоже остаются в отчёте
+        roster_ids = set(roster)
+        student_ids = roster + sorted(
+            (i for i in block['present'] if i in names and i not in roster_ids),
+            key=names.get
+        )
+        dates = [d.strftime(REPORT_DATE_FORMAT) for d in days]
+        report.append({
+            'teacher_fio': block['teacher_fio'],
+            'lesson_name': block['lesson_name'],
+            'groupname': block['groupname'],
+            'students': [
+                {
+                    'fio': names[student_id],
+                    'attendance': {
+                        date: "✔" if d in block['present'].get(student_id, ()) else "✖"
+                        for d, date in zip(days, dates)
+                    }
+                }
+                for student_id in student_ids
+            ],
+            'dates': dates
+        })
+    return report
+
+
+def student_attendance_rates(group_id, teacher_user_id=None, lesson_id=None, date_from=None, date_to=None):
+    """
+    Возвращает долю посещённых занятий для каждого студента группы.
+    Занятием считается день со сводкой по записи преподавателя-предмета.
+    """
+    attended = func.count(AttendanceRollup.day).filter(Student.id == any_(AttendanceRollup.present_students))
+    query = _filtered_rollups(db.session.query(
+        Student.id,
+        Student.fio,
+        func.count(AttendanceRollup.day).label('lessons'),
+        attended.label('attended')
+    ).select_from(Student).join(
+        AttendanceRollup, AttendanceRollup.id_group == Student.id_group
+    ).join(Teacher, AttendanceRollup.id_teacher == Teacher.id),
+        teacher_user_id, lesson_id, None, date_from, date_to)
+    rows = {row.id: row for row in query.filter(Student.id_group == group_id).group_by(Student.id, Student.fio)}
+
+    return [
+        {
+            'id': student.id,
+            'fio': student.fio,
+            'lessons': rows[student.id].lessons if student.id in rows else 0,
+            'attended': rows[student.id].attended if student.id in rows else 0,
+            'rate': round(rows[student.id].attended / rows[student.id].lessons, 4) if student.id in rows else None
+        }
+        for student in db.session.query(Student.id, Student.fio).filter(Student.id_group == group_id)
+        .order_by(Student.fio)
+    ]
+
+
+# ============================================
+# Выгрузка отчётов
+# ============================================
+
+# Размер пачки строк, читаемых серверным курсором при выгрузке
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_LAYOUTS = ('rows', 'matrix')
+
+
+def export_rows(layout='rows', teacher_user_id=None, lesson_id=None, group_id=None, date_from=None, date_to=None):
+    """
+    Генератор строк выгрузки посещаемости (списков значений) с теми же фильтрами, что у отчёта.
+    layout='rows' — строка на студента и день занятия; layout='matrix' — блоки
+    «студент × дата», как на дашборде. Сводки читаются серверным курсором пачками,
+    поэтому память не зависит от длины периода.
+    """
+    if layout == 'matrix':
+        return _export_matrix(teacher_user_id, lesson_id, group_id, date_from, date_to)
+    return _export_long(teacher_user_id, lesson_id, group_id, date_from, date_to)
+
+
+def _export_long(teacher_user_id, lesson_id, group_id, date_from, date_to):
+    yield ['Преподаватель', 'Предмет', 'Группа', 'Дата', 'Студенческий билет', 'ФИО', 'Присутствие']
+    for first, days, present, students in _report_blocks(teacher_user_id, lesson_id, group_id, date_from, date_to):
+        for day in days:
+            for student in students:
+                yield [first.teacher_fio, first.lesson_name, first.groupname, day, student.id, student.fio,
+                       "✔" if day in present.get(student.id, ()) else "✖"]
+
+
+def _export_matrix(teacher_user_id, lesson_id, group_id, date_from, date_to):
+    for first, days, present, students in _report_blocks(teacher_user_id, lesson_id, group_id, date_from, date_to):
+        yield [f'Преподаватель: {first.teacher_fio}']
+        yield [f'Предмет: {first.lesson_name}']
+        yield [f'Группа: {first.groupname}']
+        yield []
+        yield ['ФИО студента', *days]
+        for student in students:
+            attended = present.get(student.id, ())
+            yield [student.fio, *("✔" if day in attended else "✖" for day in days)]
+        yield []
+
+
+def _report_blocks(teacher_user_id, lesson_id, group_id, date_from, date_to):
+    """
+    Сводки отчёта блоками (преподаватель, группа): первая сводка блока, дни занятий,
+    дни присутствия каждого студента и студенты блока. В блок входят текущий состав группы
+    и отмеченные на её занятиях студенты, покинувшие группу, — одинаково для обоих форматов выгрузки.
+    """
+    query = _report_query(teacher_user_id, lesson_id, group_id, date_from, date_to).order_by(
+        User.fio, Lesson.lesson, Group.groupname, Teacher.id, Group.id, AttendanceRollup.day
+    )
+    # В памяти держится только текущий блок (преподаватель, группа)
+    for _, block in groupby(query.yield_per(EXPORT_BATCH_SIZE), key=lambda row: (row.teacher_id, row.group_id)):
+        block = list(block)
+        first = block[0]
+        days = [row.day for row in block]
+        present = defaultdict(set)
+        for row in block:
+            for student_id in row.present_students:
+                present[student_id].add(row.day)
+
+        students = db.session.query(Student.id, Student.fio, Student.id_group).filter(
+            (Student.id_group == first.group_id) | Student.id.in_(list(present))
+        ).order_by(Student.fio).all()
+        # Сначала состав группы, затем отмеченные студенты, покинувшие её
+        students.sort(key=lambda student: student.id_group != first.group_id)
+        yield first, days, present, students
+
+
+def _report_query(teacher_user_id, lesson_id, group_id, date_from, date_to):
+    """Сводки, отобранные фильтрами отчёта, с преподавателем, предметом и группой."""
+    return _filtered_rollups(db.session.query(
+        Teacher.id.label('teacher_id'),
+        User.fio.label('teacher_fio'),
+        Lesson.lesson.label('lesson_name'),
+        Group.id.label('group_id'),
+        Group.groupname.label('groupname'),
+        AttendanceRollup.day,
+        AttendanceRollup.present_students
+    ).select_from(AttendanceRollup).join(
+        Teacher, AttendanceRollup.id_teacher == Teacher.id
+    ).join(User, Teacher.id_user == User.id
+           ).join(Lesson, Teacher.id_lesson == Lesson.id
+                  ).join(Group, AttendanceRollup.id_group == Group.id),
+        teacher_user_id, lesson_id, group_id, date_from, date_to)
+
+
+def _filtered_rollups(query, teacher_user_id, lesson_id, group_id, date_from, date_to):
+    if teacher_user_id:
+        query = query.filter(Teacher.id_user == teacher_user_id)
+    if lesson_id:
+        query = query.filter(Teacher.id_lesson == lesson_id)
+    if group_id:
+        query = query.filter(AttendanceRollup.id_group == group_id)
+    if date_from:
+        query = query.filter(AttendanceRollup.day >= parse_report_date(date_from))
+    if date_to:
+        query = query.filter(AttendanceRollup.day <= parse_report_date(date_to))
+    return query
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import insert, or_
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.forms.register_form import BulkRegisterForm
+from app.models.role import Role
+from app.models.user import User
+
+
+def hash_password(password):
+    return generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
+
+
+def register_users_bulk(users, hash_workers=1):
+    """
+    Регистрирует пакет пользователей по принципу «все или никто».
+    Все строки проверяются до записи: роли загружаются одним запросом, логины и почты
+    сверяются с базой одним запросом и между собой. При ошибках ничего не пишется
+    и возвращается список ошибок по строкам {row, login, field, message}.
+    Хэши паролей вычисляются в пуле из hash_workers потоков, пользователи
+    вставляются одним INSERT в текущей транзакции; фиксирует вызывающий код.
+    Возвращает кортеж (число созданных пользователей, ошибки).
+    """
+    errors = []
+    rows = []
+    for number, user_data in enumerate(users, 1):
+        login = str(user_data.get('login') or 'неизвестного пользователя')
+        form = BulkRegisterForm(formdata=None, data=user_data, meta={'csrf': False})
+        if not form.validate():
+            for field, field_errors in form.errors.items():
+                errors.extend({'row': number, 'login': login, 'field': field, 'message': error}
+                              for error in field_errors)
+            continue
+        birth_date = form.birth_date.data
+        rows.append({
+            'row': number,
+            'fio': form.fio.data.strip(),
+            'mail': form.mail.data.strip(),
+            'birth_date': birth_date if isinstance(birth_date, date) else date.fromisoformat(birth_date),
+            'login': form.login.data.strip(),
+            'password': form.password.data,
+            'role': form.role.data,
+        })
+
+    roles = dict(db.session.query(Role.rolename, Role.id).filter(Role.rolename.in_({row['role'] for row in rows})))
+    taken = db.session.query(User.login, User.mail).filter(or_(
+        User.login.in_([row['login'] for row in rows]),
+        User.mail.in_([row['mail'] for row in rows])
+    )).all() if rows else []
+    taken_logins = {login for login, mail in taken}
+    taken_mails = {mail for login, mail in taken}
+
+    seen_logins = set()
+    seen_mails = set()
+    for row in rows:
+        problems = []
+        if row['role'] not in roles:
+            problems.append(('role', f"Роль {row['role']} не найдена"))
+        if row['login'] in taken_logins:
+            problems.append(('login', 'Пользователь с таким логином уже существует'))
+        elif row['login'] in seen_logins:
+            problems.append(('login', 'Логин повторяется в пакете'))
+        if row['mail'] in taken_mails:
+            problems.append(('mail', 'Пользователь с такой почтой уже существует'))
+        elif row['mail'] in seen_mails:
+            problems.append(('mail', 'Почта повторяется в пакете'))
+        seen_logins.add(row['login'])
+        seen_mails.add(row['mail'])
+        errors.extend({'row': row['row'], 'login': row['login'], 'field': field, 'message': message}
+                      for field, message in problems)
+
+    if errors or not rows:
+        errors.sort(key=lambda error: error['row'])
+        return 0, errors
+
+    # Хэширование — самая долгая часть регистрации; PBKDF2 из hashlib
+    # отпускает GIL, поэтому потоки действительно работают параллельно
+    passwords = [row['password'] for row in rows]
+    if hash_workers > 1 and len(passwords) > 1:
+        with ThreadPoolExecutor(max_workers=min(hash_workers, len(passwords))) as pool:
+            hashes = list(pool.map(hash_password, passwords))
+    else:
+        hashes = [hash_password(password) for password in passwords]
+
+    db.session.execute(insert(User), [
+        {
+            'fio': row['fio'],
+            'mail': row['mail'],
+            'birth_date': row['birth_date'],
+            'login': row['login'],
+            'password': password_hash,
+            'id_role': roles[row['role']],
+            'first_start': True,
+        }
+        for row, password_hash in zip(rows, hashes)
+    ])
+    return len(rows), []
@@ -73,6 +73,18 @@ document.addEventListener('DOMContentLoaded', () => {
     const loadingModal = document.getElementById('loadingModal');
     const loadingText = document.getElementById('loadingText');
 
+    // Студенты загружаются страницами: следующая запрашивается,
+    // когда при прокрутке становится виден конец таблицы
+    const PAGE_SIZE = 100;
+    let nextCursor = null;
+    let loadingPage = false;
+    let listRequestId = 0;
+    const pageSentinel = document.createElement('div');
+    elements.studentsTable.after(pageSentinel);
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextStudentsPage();
+    }).observe(pageSentinel);
+
     // Инициализация отображения
     elements.studentsList.style.display = "block";
     elements.exportExcelStudents.style.display = "inline-block";
@@ -185,9 +197,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
     elements.exportExcelStudents.addEventListener("click", exportToExcelStudents);
 
-    function exportToExcelStudents() {
+    // В таблице загружены не все страницы, поэтому выгружается полный список по текущим фильтрам
+    async function exportToExcelStudents() {
         const table = document.getElementById('studentsTable');
-        const rows = table.querySelectorAll('tbody tr');
+        const response = await fetchWithCookie(`/auth/admin/api/students?${studentsParams().toString()}`);
+        const students = await response.json();
         const data = [];
         const headers = [];
         table.querySelectorAll('thead th').forEach((th, index) => {
@@ -198,14 +212,8 @@ document.addEventListener('DOMContentLoaded', () => {
         });
         data.push(headers);
 
-        rows.forEach(row => {
-            const rowData = [];
-            row.querySelectorAll('td').forEach((td, index) => {
-                if (index < 5) {
-                    rowData.push(td.textContent.trim());
-                }
-            });
-            data.push(rowData);
+        students.forEach(student => {
+            data.push([student.student_id_display, student.fio, student.group, student.mail, student.birth_date]);
         });
 
         const ws = XLSX.utils.aoa_to_sheet(data);
@@ -267,15 +275,41 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
-    // Загрузка списка студентов
-    function loadStudents() {
+    // Параметры списка студентов по текущим фильтрам
+    function studentsParams() {
+        const params = new URLSearchParams();
         const groupId = elements.groupFilter.value;
-        fetchWithCookie(`/auth/admin/api/students?group_id=${groupId || ''}`)
+        const search = elements.searchFio.value.trim();
+        if (groupId) params.set('group_id', groupId);
+        if (search) params.set('q', search);
+        return params;
+    }
+
+    // Загрузка списка студентов с первой страницы
+    function loadStudents() {
+        listRequestId++;
+        nextCursor = null;
+        elements.tableBody.innerHTML = '';
+        loadStudentsPage();
+    }
+
+    function loadNextStudentsPage() {
+        if (nextCursor && !loadingPage) loadStudentsPage();
+    }
+
+    function loadStudentsPage() {
+        const requestId = listRequestId;
+        const params = studentsParams();
+        params.set('limit', PAGE_SIZE);
+        if (nextCursor) params.set('after', nextCursor);
+        loadingPage = true;
+        fetchWithCookie(`/auth/admin/api/students?${params.toString()}`)
             .then(response => response.json())
             .then(data => {
-                const tableBody = elements.studentsTable.querySelector('tbody');
-                tableBody.innerHTML = '';
-                data.forEach(student => {
+                // Ответ на запрос с устаревшим фильтром не отображается
+                if (requestId !== listRequestId) return;
+                nextCursor = data.next_cursor;
+                data.students.forEach(student => {
                     const row = document.createElement('tr');
                     row.innerHTML = `
                         <td>${student.student_id_display}</td>
@@ -285,8 +319,15 @@ document.addEventListener('DOMContentLoaded', () => {
                         <td>${student.birth_date}</td>
                         <td><button class="removeRow" data-id="${student.id}">Удалить</button></td>
                     `;
-                    tableBody.appendChild(row);
+                    elements.tableBody.appendChild(row);
                 });
+                if (sortState.column) sortTable(sortState.column);
+            })
+            .finally(() => {
+                if (requestId !== listRequestId) return;
+                loadingPage = false;
+                // Страница целиком поместилась на экране — сразу запрашиваем следующую
+                if (pageSentinel.getBoundingClientRect().top < window.innerHeight) loadNextStudentsPage();
             });
     }
 
@@ -313,13 +354,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
     elements.groupFilter.addEventListener('change', loadStudents);
 
+    // Поиск по началу ФИО выполняется на сервере после паузы в наборе
+    let searchTimer = null;
     elements.searchFio.addEventListener('input', () => {
-        const filter = elements.searchFio.value.toLowerCase();
-        const rows = elements.studentsTable.querySelectorAll('tbody tr');
-        rows.forEach(row => {
-            const fio = row.cells[1].textContent.toLowerCase();
-            row.style.display = fio.includes(filter) ? '' : 'none';
-        });
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(loadStudents, 300);
     });
 
     // Обработка кнопки "Далее" для выбора группы
@@ -477,6 +516,41 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append(`students[${index}][photo]`, photo);
         });
 
+        // Ожидание фонового задания на добавление студентов с показом прогресса
+        function waitForEnrollmentJob(jobId) {
+            const poll = async () => {
+                try {
+                    const response = await fetchWithCookie(`/auth/admin/api/enrollment_jobs/${jobId}`);
+                    const data = await response.json();
+                    if (!data.success) {
+                        throw new Error(data.message);
+                    }
+                    const job = data.job;
+                    if (job.status === 'pending' || job.status === 'running') {
+                        loadingText.textContent = `Кодирование фотографий: ${job.processed} из ${job.total}`;
+                        setTimeout(poll, 1000);
+                        return;
+                    }
+                    loadingModal.style.display = 'none';
+                    document.body.classList.remove('modal-open');
+                    if (job.status === 'done') {
+                        elements.createTable.querySelector('tbody').innerHTML = '';
+                        const problems = job.students.filter(s => s.status !== 'ok');
+                        const details = problems.map(s => `${s.fio}: ${s.message}`).join('\n');
+                        alert(problems.length ? `Студенты добавлены. Замечания:\n${details}` : 'Студенты добавлены');
+                    } else {
+                        alert(job.error || 'Ошибка при добавлении');
+                    }
+                } catch (error) {
+                    loadingModal.style.display = 'none';
+                    document.body.classList.remove('modal-open');
+                    console.error('Ошибка:', error);
+                    alert('Ошибка при получении статуса добавления студентов.');
+                }
+            };
+            poll();
+        }
+
         // Сначала проверяем дубликаты
         const xhrCheck = new XMLHttpRequest();
         xhrCheck.open('POST', '/auth/admin/api/check_duplicates', true);
@@ -508,18 +582,16 @@ document.addEventListener('DOMContentLoaded', () => {
                                 loadingModal.style.display = 'none';
                                 document.body.classList.remove('modal-open');
 
-                                if (xhr.status === 200) {
+                                if (xhr.status === 202) {
                                     const response = JSON.parse(xhr.responseText);
-                                    if (response.success) {
-                                        elements.createTable.querySelector('tbody').innerHTML = '';
-                                        alert('Студенты добавлены');
-                                    } else {
-                                        alert(response.message || 'Ошибка при добавлении');
-                                    }
+                                    loadingModal.style.display = 'block';
+                                    document.body.classList.add('modal-open');
+                                    waitForEnrollmentJob(response.job_id);
                                 } else if (xhr.status === 401) {
                                     window.location.href = '/auth/login';
                                 } else {
-                                    alert('Ошибка при отправке данных.');
+                                    const response = JSON.parse(xhr.responseText || '{}');
+                                    alert(response.message || 'Ошибка при отправке данных.');
                                 }
                             }
                         };
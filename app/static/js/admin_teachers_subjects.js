@@ -219,7 +219,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let subjectsList = [];
 
     function loadDropdowns() {
-        fetchWithCookie('/auth/admin/api/users')
+        fetchWithCookie('/auth/admin/api/users?role=teacher')
             .then(response => response.json())
             .then(data => {
                 const teachers = data.users.filter(user => user.role === 'teacher');
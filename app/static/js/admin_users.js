@@ -173,12 +173,11 @@ document.addEventListener('DOMContentLoaded', () => {
         });
         elements.savePasswordButton?.addEventListener('click', saveNewPassword);
 
+        // Поиск по началу ФИО выполняется на сервере после паузы в наборе
+        let searchTimer = null;
         elements.searchFio.addEventListener('input', () => {
-            const filter = elements.searchFio.value.toLowerCase();
-            elements.displayTableBody.querySelectorAll('tr').forEach(row => {
-                const fio = row.cells[0].textContent.toLowerCase();
-                row.style.display = fio.includes(filter) ? '' : 'none';
-            });
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(loadUsers, 300);
         });
     }
 
@@ -201,25 +200,62 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // ============================================
     // Загрузка списка пользователей
-    // ============================================
-    async function loadUsers() {
+    // Пользователи загружаются страницами: следующая запрашивается,
+    // когда при прокрутке становится виден конец таблицы
+    // ============================================
+    const PAGE_SIZE = 100;
+    let nextCursor = null;
+    let loadingPage = false;
+    let listRequestId = 0;
+    const pageSentinel = document.createElement('div');
+    elements.usersTableDisplay.after(pageSentinel);
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadNextUsersPage();
+    }).observe(pageSentinel);
+
+    function loadUsers() {
+        listRequestId++;
+        nextCursor = null;
+        elements.displayTableBody.innerHTML = '';
+        return loadUsersPage();
+    }
+
+    function loadNextUsersPage() {
+        if (nextCursor && !loadingPage) loadUsersPage();
+    }
+
+    async function loadUsersPage() {
+        const requestId = listRequestId;
+        const params = new URLSearchParams({limit: PAGE_SIZE});
+        const search = elements.searchFio.value.trim();
+        if (search) params.set('q', search);
+        if (nextCursor) params.set('after', nextCursor);
+        loadingPage = true;
         try {
-            const response = await fetchWithCookie('/auth/admin/api/users', {
+            const response = await fetchWithCookie(`/auth/admin/api/users?${params.toString()}`, {
                 method: 'GET'
             });
             if (!response.ok) throw new Error('Ошибка сети');
             const data = await response.json();
+            // Ответ на запрос с устаревшим фильтром не отображается
+            if (requestId !== listRequestId) return;
+            nextCursor = data.next_cursor;
             renderUsers(data.users || []);
         } catch (error) {
             console.error('Ошибка загрузки пользователей:', error);
+        } finally {
+            if (requestId === listRequestId) loadingPage = false;
+        }
+        // Страница целиком поместилась на экране — сразу запрашиваем следующую
+        if (requestId === listRequestId && pageSentinel.getBoundingClientRect().top < window.innerHeight) {
+            loadNextUsersPage();
         }
     }
 
     // ============================================
-    // Отрисовка пользователей в таблице
+    // Отрисовка пользователей в таблице (страница добавляется в конец)
     // ============================================
     function renderUsers(users) {
-        elements.displayTableBody.innerHTML = '';
         if (users.length > 0) {
             users.forEach(user => {
                 const isCurrentUser = parseInt(user.id) === currentUserId;
@@ -237,7 +273,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 `;
                 elements.displayTableBody.appendChild(row);
             });
-        } else {
+        } else if (!elements.displayTableBody.children.length) {
             elements.displayTableBody.innerHTML = '<tr><td colspan="6">Нет пользователей</td></tr>';
         }
     }
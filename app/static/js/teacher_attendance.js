@@ -59,13 +59,28 @@ document.addEventListener('DOMContentLoaded', function () {
     let screenshotCtx = screenshotCanvas.getContext('2d');
     let capturing = false;
     let intervalId;
+    let eventSource = null;
+    let frameCounter = 0;
+    const pendingFrames = new Map();
     let recognizedStudents = [];
     let selectedSubjectId = null;
+    let selectedGroupId = null;
+    let sessionKey = null;
     let faceLocations = [];
     let faceNames = [];
     let currentFacingMode = 'user';
 
 
+    // Ключ сессии отметки: повторная отправка той же сессии не создаёт дубликатов
+    function newSessionKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        // crypto.randomUUID недоступен вне HTTPS: UUID v4 из getRandomValues
+        return ([1e7] + -1e3 + -4e3 + -8e3 + -1e11).replace(/[018]/g, c =>
+            (c ^ crypto.getRandomValues(new Uint8Array(1))[0] & 15 >> c / 4).toString(16));
+    }
+
     // Проверка на мобильное устройство
     function isMobileDevice() {
         return /Android|webOS|iPhone|iPad|iPod|BlackBerry|IEMobile|Opera Mini/i.test(navigator.userAgent);
@@ -95,6 +110,8 @@ document.addEventListener('DOMContentLoaded', function () {
                 alert('Ошибка загрузки данных для группы.');
                 return;
             }
+            selectedGroupId = data.group_id;
+            sessionKey = newSessionKey();
         } catch (error) {
             console.error('Ошибка:', error);
             alert('Ошибка связи с сервером.');
@@ -164,12 +181,31 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // Запуск захвата: потоковый режим через SSE, если браузер его поддерживает, иначе опрос
+    function startCapture() {
+        if (window.EventSource) {
+            startStream();
+            intervalId = setInterval(captureAndPush, 1000);
+        } else {
+            intervalId = setInterval(captureAndUpload, 2500);
+        }
+    }
+
+    function stopCapture() {
+        clearInterval(intervalId);
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+        pendingFrames.clear();
+    }
+
     // Обработчик кнопки "Старт"
     document.getElementById('startBtn').addEventListener('click', function () {
         if (!capturing) {
             capturing = true;
             statusDiv.innerText = 'Захват лиц запущен.';
-            intervalId = setInterval(captureAndUpload, 2500);
+            startCapture();
         }
     });
 
@@ -177,7 +213,7 @@ document.addEventListener('DOMContentLoaded', function () {
     document.getElementById('pauseBtn').addEventListener('click', function () {
         if (capturing) {
             capturing = false;
-            clearInterval(intervalId);
+            stopCapture();
             if (recognizedStudents.length > 0) {
                 let names = recognizedStudents.map(s => s.fio).join(', ');
                 statusDiv.innerText = 'Распознанные студенты: ' + names;
@@ -191,7 +227,7 @@ document.addEventListener('DOMContentLoaded', function () {
     document.getElementById('stopBtn').addEventListener('click', function () {
         if (capturing) {
             capturing = false;
-            clearInterval(intervalId);
+            stopCapture();
         }
         if (video.srcObject) {
             video.srcObject.getTracks().forEach(track => track.stop());
@@ -202,20 +238,116 @@ document.addEventListener('DOMContentLoaded', function () {
         fillAttendanceTable(recognizedStudents);
     });
 
+    // Подписка на SSE-поток результатов распознавания
+    function startStream() {
+        eventSource = new EventSource(`/auth/teacher/api/stream/events?group_id=${encodeURIComponent(selectedGroupId)}`);
+
+        eventSource.addEventListener('faces', function (event) {
+            const data = JSON.parse(event.data);
+            const frameId = Number(data.frame_id);
+            const frameBlob = pendingFrames.get(frameId);
+            // Кадры старше обработанного сервер уже отбросил
+            for (const id of pendingFrames.keys()) {
+                if (id <= frameId) {
+                    pendingFrames.delete(id);
+                }
+            }
+            applyRecognition(data, frameBlob);
+        });
+
+        eventSource.addEventListener('student', function (event) {
+            const student = JSON.parse(event.data);
+            if (!recognizedStudents.find(s => s.fio === student.fio)) {
+                recognizedStudents.push({fio: student.fio});
+            }
+            statusDiv.innerText = 'Распознан: ' + student.fio;
+        });
+
+        eventSource.addEventListener('frame_error', function (event) {
+            console.error('Ошибка распознавания: ', JSON.parse(event.data).error);
+        });
+    }
+
+    // Захват кадра и отправка в потоковую сессию без ожидания результата
+    async function captureAndPush() {
+        ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+        try {
+            const frameBlob = await canvasToBlob(canvas);
+            const frameId = ++frameCounter;
+            pendingFrames.set(frameId, frameBlob);
+            // Храним только несколько последних кадров для отрисовки рамок
+            if (pendingFrames.size > 5) {
+                pendingFrames.delete(pendingFrames.keys().next().value);
+            }
+            fetchWithCookie(`/auth/teacher/api/stream/frame?group_id=${encodeURIComponent(selectedGroupId)}&frame_id=${frameId}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'image/jpeg',
+                },
+                body: frameBlob,
+            }).catch(error => console.error('Ошибка отправки кадра:', error));
+        } catch (error) {
+            console.error('Ошибка:', error);
+            statusDiv.innerText = 'Ошибка: ' + error.message;
+        }
+    }
+
+    // Применение результата распознавания кадра
+    function applyRecognition(data, frameBlob) {
+        faceLocations = [];
+        faceNames = [];
+
+        if (data.face_locations && data.recognized) {
+            faceLocations = data.face_locations;
+            data.recognized.forEach(r => {
+                faceNames[r.face_index] = r.fio;
+            });
+        }
+
+        data.recognized.forEach(recognizedStudent => {
+            if (!recognizedStudents.find(s => s.fio === recognizedStudent.fio)) {
+                recognizedStudents.push({fio: recognizedStudent.fio});
+            }
+        });
+
+        if (frameBlob) {
+            displayScreenshotWithFaces(frameBlob);
+        }
+    }
+
+    // Получение JPEG-кадра из canvas в виде Blob
+    function canvasToBlob(sourceCanvas) {
+        return new Promise((resolve, reject) => {
+            sourceCanvas.toBlob(blob => {
+                if (blob) {
+                    resolve(blob);
+                } else {
+                    reject(new Error('Не удалось получить кадр с камеры'));
+                }
+            }, 'image/jpeg', 0.85);
+        });
+    }
+
     // Захват и отправка кадра
     async function captureAndUpload() {
         ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-        let dataURL = canvas.toDataURL('image/jpeg');
 
         try {
-            const response = await fetchWithCookie('/auth/teacher/api/recognize', {
+            const frameBlob = await canvasToBlob(canvas);
+            const response = await fetchWithCookie(`/auth/teacher/api/recognize?group_id=${encodeURIComponent(selectedGroupId)}`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
+                    'Content-Type': 'image/jpeg',
                 },
-                body: JSON.stringify({image: dataURL}),
+                body: frameBlob,
             });
 
+            // Сервер перегружен: пропускаем кадр, следующий уйдёт по таймеру
+            if (response.status === 429 || response.status === 503) {
+                console.warn('Сервер распознавания занят, кадр пропущен');
+                return;
+            }
+
             if (!response.ok) {
                 const errorData = await response.json();
                 throw new Error(errorData.error || `Ошибка сервера: ${response.status}`);
@@ -225,21 +357,7 @@ document.addEventListener('DOMContentLoaded', function () {
             if (data.error) {
                 console.error('Ошибка распознавания: ', data.error);
             } else {
-                faceLocations = [];
-                faceNames = [];
-
-                if (data.face_locations && data.recognized) {
-                    faceLocations = data.face_locations;
-                    faceNames = data.recognized.map(r => r.fio);
-                }
-
-                data.recognized.forEach(recognizedStudent => {
-                    if (!recognizedStudents.find(s => s.fio === recognizedStudent.fio)) {
-                        recognizedStudents.push({fio: recognizedStudent.fio});
-                    }
-                });
-
-                displayScreenshotWithFaces(dataURL);
+                applyRecognition(data, frameBlob);
             }
         } catch (error) {
             console.error('Ошибка:', error);
@@ -248,9 +366,11 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     // Отображение скриншота с рамками и подписями
-    function displayScreenshotWithFaces(dataURL) {
+    function displayScreenshotWithFaces(frameBlob) {
         const img = new Image();
+        const frameUrl = URL.createObjectURL(frameBlob);
         img.onload = function () {
+            URL.revokeObjectURL(frameUrl);
             screenshotCtx.clearRect(0, 0, screenshotCanvas.width, screenshotCanvas.height);
             screenshotCtx.drawImage(img, 0, 0, screenshotCanvas.width, screenshotCanvas.height);
 
@@ -274,7 +394,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 screenshotCtx.fillText(name, scaledLeft, scaledTop - 10);
             });
         };
-        img.src = dataURL;
+        img.src = frameUrl;
     }
 
     // Заполнение итоговой таблицы посещаемости
@@ -332,7 +452,8 @@ document.addEventListener('DOMContentLoaded', function () {
             body: JSON.stringify({
                 students: attendanceData,
                 subject_id: selectedSubjectId,
-                group_id: groupId
+                group_id: groupId,
+                session_key: sessionKey
             })
         })
             .then(response => response.json())
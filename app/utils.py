@@ -1,9 +1,21 @@
+import re
 from datetime import datetime
+
+from flask import current_app
 from werkzeug.security import generate_password_hash
 
 from app import db
 from app.models.user import User
 from app.models.role import Role
+from app.models.encoder_version import EncoderVersion
+
+def custom_secure_filename(filename):
+    """
+    Сохраняет кириллицу, удаляя недопустимые символы.
+    Заменяет пробелы на подчеркивания и оставляет только буквы, цифры, дефис, точку и подчеркивание.
+    """
+    filename = filename.strip().replace(' ', '_')
+    return re.sub(r'(?u)[^-\w.]', '', filename)
 
 # Создание ролей при первом старте и пустой базе данных
 def init_roles():
@@ -41,4 +53,11 @@ def init_admin():
         )
         # Добавляем нового администратора в сессию и сохраняем изменения
         db.session.add(new_admin)
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+
+# Регистрация версии кодировщика по умолчанию (FACE_ENCODING_MODEL)
+def init_encoder_versions():
+    name = current_app.config['FACE_ENCODING_MODEL']
+    if db.session.get(EncoderVersion, name) is None:
+        db.session.add(EncoderVersion(name=name, num_jitters=1, landmarks_model='small'))
+        db.session.commit()
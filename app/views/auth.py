@@ -5,6 +5,7 @@ from werkzeug.security import check_password_hash
 from functools import wraps
 
 from app.models.user import User
+from app.services.identity import current_identity
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -17,21 +18,22 @@ def role_required(*roles):
     """
     Декоратор, который проверяет, что текущий пользователь авторизован через JWT
     и его роль входит в указанный список roles.
+    Сам проверяет JWT, поэтому отдельный @jwt_required() у представления не нужен.
+    Роль берётся из claims токена, а существование пользователя проверяется
+    через кэш пользователей: обычно без запроса к базе данных.
     """
 
     def wrapper(f):
         @wraps(f)
         @jwt_required()  # Требуем JWT-токен
         def decorated_view(*args, **kwargs):
-            user_id = get_jwt_identity()
-            user = User.query.get(int(user_id))
             claims = get_jwt()
-            if not user:
-                flash("Пользователь не найден", "error")
-                return redirect(url_for('auth.login'))
             if claims.get('role') not in roles:
                 flash("Доступ запрещён", "error")
                 return redirect(url_for('auth.login'))
+            if current_identity() is None:
+                flash("Пользователь не найден", "error")
+                return redirect(url_for('auth.login'))
             return f(*args, **kwargs)
 
         return decorated_view
@@ -92,15 +94,13 @@ def api_login():
 @auth_bp.route('/api/current_user', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    current_token = get_jwt()
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         if user:
             return jsonify({
                 'id': user.id,
                 'fio': user.fio,
-                'role': user.role.rolename
+                'role': user.role
             })
         return jsonify({'message': 'Пользователь не найден'}), 404
     except Exception as e:
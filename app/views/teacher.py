@@ -1,47 +1,53 @@
 import base64
 import json
 import re
-import smtplib
-import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-import pytz
-from datetime import datetime, timedelta
-
-import cv2
-import face_recognition
-import numpy as np
-from flask import Blueprint, render_template, request, jsonify, current_app
+import time
+
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash
 
 from app import db
-from app.models.attendance import Attendance
+from app.models.attendance_rollup import AttendanceRollup
 from app.models.lesson import Lesson
 from app.models.student import Student
 from app.models.teacher import Teacher
 from app.models.user import User
 from app.models.group import Group
+from app.models.encoder_version import EncoderVersion
+from app.services.attendance import AttendanceSessionConflict, save_attendance
+from app.services.embeddings import encoder_settings
+from app.services.face_gallery import GroupNotFound, face_gallery
+from app.services.face_index import face_index
+from app.services.identity import current_identity, identity_cache
+from app.services.face_matcher import match_faces
+from app.services.face_references import live_reference_candidates, live_references
+from app.services.face_tracker import face_trackers
+from app.services.frame_stream import frame_slots
+from app.services.listings import STUDENT_ORDER, listing, student_rows, student_to_dict
+from app.services.lookup_cache import lookup_cache
+from app.services.pagination import InvalidPageRequest
+from app.services.mail_outbox import queue_absence_emails
+from app.services.face_workers import face_workers, FaceWorkersBusy, FaceJobFailed
+from app.services.recognition import analyze_frame, detection_settings
+from app.services.report_export import ExportUnavailable, export_response
+from app.services.reports import (attendance_report, moscow_tz, present_student_ids, refresh_rollup,
+                                  student_attendance_rates)
 from app.views.auth import role_required
 
 teacher_bp = Blueprint('teacher', __name__, url_prefix='/auth/teacher')
 
-# Глобальные переменные для хранения известных лиц и их ID
-current_known_faces = []
-current_known_ids = []
-
 # ============================================
 # Приветствие и общие маршруты
 # ============================================
 
 @teacher_bp.route('/hello')
-@jwt_required()
 @role_required('teacher')
 def hello():
     """Отображает страницу приветствия для преподавателя."""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_identity()
     return render_template('teacher_hello.html', first_start=user.first_start, user_id=user.id, current_user=user)
 
 # ============================================
@@ -49,7 +55,6 @@ def hello():
 # ============================================
 
 @teacher_bp.route('/dashboard', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
 def dashboard():
     """
@@ -62,8 +67,8 @@ def dashboard():
     lessons = [{'id': t.lesson.id, 'lesson': t.lesson.lesson} for t in teacher_subjects]
 
     groups = (Group.query
-              .join(Attendance, Attendance.id_group == Group.id)
-              .join(Teacher, Attendance.id_teacher == Teacher.id)
+              .join(AttendanceRollup, AttendanceRollup.id_group == Group.id)
+              .join(Teacher, AttendanceRollup.id_teacher == Teacher.id)
               .filter(Teacher.id_user == user_id)
               .distinct()
               .all())
@@ -76,88 +81,14 @@ def dashboard():
     date_to = request.args.get('date_to')
 
     if request.args.get('format', '').lower() == 'json':
-        query = db.session.query(
-            User.fio.label('teacher_fio'),
-            Lesson.lesson.label('lesson_name'),
-            Group.groupname.label('groupname'),
-            Student.id.label('student_id'),
-            Student.fio.label('student_fio'),
-            Attendance.timestamp
-        ).select_from(Teacher).filter(Teacher.id_user == user_id
-                                      ).join(User, Teacher.id_user == User.id
-                                             ).join(Lesson, Teacher.id_lesson == Lesson.id
-                                                    ).join(Attendance, Attendance.id_teacher == Teacher.id
-                                                           ).join(Group, Attendance.id_group == Group.id
-                                                                  ).outerjoin(Student,
-                                                                              Attendance.id_student == Student.id)
-
-        if lesson_id:
-            query = query.filter(Lesson.id == lesson_id)
-        if group_id:
-            query = query.filter(Group.id == group_id)
-        if date_from:
-            date_from = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Attendance.timestamp >= date_from)
-        if date_to:
-            date_to = datetime.strptime(date_to, '%Y-%m-%d')
-            date_to_end = date_to + timedelta(days=1)
-            query = query.filter(Attendance.timestamp < date_to_end)
-
-        attendance_records = query.all()
-
-        if not attendance_records:
+        report = attendance_report(user_id, lesson_id, group_id, date_from, date_to)
+        if not report:
             return jsonify({"message": "Невозможно сформировать отчёт о посещаемости по этому фильтру"}), 200
-
-        attendance_data = {}
-        for record in attendance_records:
-            key = (record.teacher_fio, record.lesson_name, record.groupname)
-            date_str = record.timestamp.date().strftime("%d.%m.%Y")
-            if key not in attendance_data:
-                attendance_data[key] = {
-                    'teacher_fio': record.teacher_fio,
-                    'lesson_name': record.lesson_name,
-                    'groupname': record.groupname,
-                    'students': {},
-                    'dates': set()
-                }
-            attendance_data[key]['dates'].add(date_str)
-            if record.student_fio:
-                if record.student_fio not in attendance_data[key]['students']:
-                    attendance_data[key]['students'][record.student_fio] = {}
-                attendance_data[key]['students'][record.student_fio][date_str] = "✔"
-
-        for key in attendance_data.keys():
-            group = Group.query.filter_by(groupname=key[2]).first()
-            if group:
-                students_in_group = Student.query.filter_by(id_group=group.id).all()
-                for student in students_in_group:
-                    if student.fio not in attendance_data[key]['students']:
-                        attendance_data[key]['students'][student.fio] = {date: "✖" for date in attendance_data[key]['dates']}
-                    else:
-                        for date in attendance_data[key]['dates']:
-                            if date not in attendance_data[key]['students'][student.fio]:
-                                attendance_data[key]['students'][student.fio][date] = "✖"
-
-        response = {
-            'attendance_by_group': [
-                {
-                    'teacher_fio': data['teacher_fio'],
-                    'lesson_name': data['lesson_name'],
-                    'groupname': data['groupname'],
-                    'students': [
-                        {'fio': fio, 'attendance': {date: att.get(date, "✖") for date in sorted(data['dates'])}}
-                        for fio, att in data['students'].items()
-                    ],
-                    'dates': sorted(data['dates'])
-                } for data in attendance_data.values()
-            ]
-        }
-        return jsonify(response)
+        return jsonify({'attendance_by_group': report})
 
     return render_template('teacher_dashboard.html', lessons=lessons, groups=groups_data)
 
 @teacher_bp.route('/api/attendance', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
 def get_attendance():
     """
@@ -171,38 +102,74 @@ def get_attendance():
     selected_date_obj = datetime.strptime(selected_date, "%d.%m.%Y").date()
 
     user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(id_user=user_id).first()
-    attendance_records = Attendance.query.filter(
-        Attendance.id_group == group_id,
-        db.func.date(Attendance.timestamp) == selected_date_obj,
-        Attendance.id_teacher == teacher.id
-    ).all()
-
-    attendance_dict = {record.id_student: True for record in attendance_records if record.id_student}
+    teacher_ids = [teacher_id for (teacher_id,) in db.session.query(Teacher.id).filter(Teacher.id_user == user_id)]
+    present_ids = present_student_ids(group_id, selected_date_obj, teacher_ids)
 
     response = {
         "group_id": group_id,
         "date": selected_date,
         "students": [
-            {"fio": student.fio, "present": "✔" if student.id in attendance_dict else "✖"}
+            {"fio": student.fio, "present": "✔" if student.id in present_ids else "✖"}
             for student in students
         ]
     }
     return jsonify(response)
 
+@teacher_bp.route('/api/attendance_export', methods=['GET'])
+@role_required('teacher')
+def export_attendance():
+    """
+    Выгружает посещаемость в CSV или XLSX (параметр format) с фильтрацией по предмету, группе и датам.
+    layout=rows — строка на студента и день занятия, layout=matrix — матрица «студент × дата», как на дашборде.
+    """
+    group_id = request.args.get('group_id')
+    try:
+        return export_response(
+            request.args.get('format', 'csv').lower(),
+            request.args.get('layout', 'rows').lower(),
+            teacher_user_id=get_jwt_identity(),
+            lesson_id=request.args.get('lesson_id', type=int),
+            group_id=int(group_id) if group_id and group_id.isdigit() else None,
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to')
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except ExportUnavailable as e:
+        return jsonify({"message": str(e)}), 501
+
+@teacher_bp.route('/api/attendance_rates', methods=['GET'])
+@role_required('teacher')
+def get_attendance_rates():
+    """
+    Возвращает долю посещённых занятий преподавателя для каждого студента группы.
+    Поддерживает фильтрацию по предмету и датам (ГГГГ-ММ-ДД).
+    """
+    group_id = request.args.get('group_id', type=int)
+    if not group_id:
+        return jsonify({"message": "Не указана группа"}), 400
+    rates = student_attendance_rates(
+        group_id,
+        teacher_user_id=get_jwt_identity(),
+        lesson_id=request.args.get('lesson_id', type=int),
+        date_from=request.args.get('date_from'),
+        date_to=request.args.get('date_to')
+    )
+    return jsonify({"group_id": group_id, "students": rates})
+
 # ============================================
 # Дополнительные API для фильтров
 # ============================================
 
 @teacher_bp.route('/api/get_groups_by_lesson', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
+@lookup_cache.cached(per_user=True)
 def get_groups_by_lesson():
     """Возвращает список групп для указанного предмета."""
     lesson_id = request.args.get('lesson_id', type=int)
     if lesson_id:
         user_id = get_jwt_identity()
-        groups = Group.query.join(Student).join(Attendance).join(Teacher).filter(
+        groups = Group.query.join(AttendanceRollup).join(Teacher).filter(
             Teacher.id_lesson == lesson_id,
             Teacher.id_user == user_id
         ).distinct().all()
@@ -210,8 +177,8 @@ def get_groups_by_lesson():
     return jsonify([])
 
 @teacher_bp.route('/api/get_lessons_by_teacher', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
+@lookup_cache.cached(per_user=True)
 def get_lessons_by_teacher():
     """Возвращает список предметов для текущего преподавателя."""
     user_id = get_jwt_identity()
@@ -219,26 +186,26 @@ def get_lessons_by_teacher():
     return jsonify([{'id': lesson.id, 'name': lesson.lesson} for lesson in lessons])
 
 @teacher_bp.route('/api/get_groups_by_teacher', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
+@lookup_cache.cached(per_user=True)
 def get_groups_by_teacher():
     """Возвращает список групп для текущего преподавателя."""
     user_id = get_jwt_identity()
-    groups = Group.query.join(Attendance).join(Teacher).filter(
+    groups = Group.query.join(AttendanceRollup).join(Teacher).filter(
         Teacher.id_user == user_id
     ).distinct().all()
     return jsonify([{'id': group.id, 'name': group.groupname} for group in groups])
 
 @teacher_bp.route('/api/get_lessons_by_group', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
+@lookup_cache.cached(per_user=True)
 def get_lessons_by_group():
     """Возвращает список предметов для указанной группы."""
     group_id = request.args.get('group_id', type=int)
     if group_id:
         user_id = get_jwt_identity()
-        lessons = Lesson.query.join(Teacher).join(Attendance).filter(
-            Attendance.id_group == group_id,
+        lessons = Lesson.query.join(Teacher).join(AttendanceRollup).filter(
+            AttendanceRollup.id_group == group_id,
             Teacher.id_user == user_id
         ).distinct().all()
         return jsonify([{'id': lesson.id, 'name': lesson.lesson} for lesson in lessons])
@@ -249,7 +216,6 @@ def get_lessons_by_group():
 # ============================================
 
 @teacher_bp.route('/take_attendance')
-@jwt_required()
 @role_required('teacher')
 def take_attendance():
     """
@@ -262,7 +228,7 @@ def take_attendance():
     groups = Group.query.join(Student, Group.id == Student.id_group).distinct().all()
     groups_data = [{'id': g.id, 'groupname': g.groupname} for g in groups]
 
-    user = User.query.get(user_id)
+    user = current_identity()
     return render_template(
         'teacher_attendance.html',
         subjects=subjects,
@@ -271,197 +237,378 @@ def take_attendance():
         user_id=user_id
     )
 
-def send_absence_email(student, subject_name, teacher_fio):
-    """
-    Отправляет email студенту об отсутствии на занятии.
-    Использует конфигурацию почты из приложения.
-    """
-    mail_host = current_app.config.get("MAIL_HOST")
-    mail_port = current_app.config.get("MAIL_PORT")
-    mail_username = current_app.config.get("MAIL_USERNAME")
-    mail_password = current_app.config.get("MAIL_PASSWORD")
-    mail_from = current_app.config.get("MAIL_FROM")
-
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Отсутствие на занятии"
-    message["From"] = mail_from
-    message["To"] = student.mail
-
-    text = (f"Уважаемый(ая) {student.fio},\n\n"
-            f"Вы отсутствовали на занятии по предмету {subject_name} у преподавателя {teacher_fio}.\n"
-            "Просьба предоставить документ, подтверждающий уважительную причину пропуска занятия.\n\n"
-            "С уважением,\nВаше учебное заведение.")
-    html = f"""\
-    <html>
-      <body>
-        <p>Уважаемый(ая) {student.fio},<br><br>
-           Вы отсутствовали на занятии по предмету <strong>{subject_name}</strong> у преподавателя <strong>{teacher_fio}</strong>.<br>
-           Просьба предоставить документ, подтверждающий уважительную причину пропуска занятия.<br><br>
-           С уважением,<br>
-           Ваше учебное заведение.
-        </p>
-      </body>
-    </html>
-    """
-    part1 = MIMEText(text, "plain")
-    part2 = MIMEText(html, "html")
-    message.attach(part1)
-    message.attach(part2)
-
-    context = ssl.create_default_context()
-    try:
-        with smtplib.SMTP_SSL(mail_host, mail_port, context=context) as server:
-            server.login(mail_username, mail_password)
-            server.sendmail(mail_from, student.mail, message.as_string())
-        print(f"Письмо отправлено студенту: {student.fio} ({student.mail})")
-    except Exception as e:
-        print(f"Ошибка отправки письма студенту {student.fio}: {e}")
+# Ключ занятия — UUID, создаваемый клиентом
+SESSION_KEY_RE = re.compile(r'^[0-9a-fA-F-]{36}$')
 
 @teacher_bp.route('/api/submit_attendance', methods=['POST'])
-@jwt_required()
 @role_required('teacher')
 def submit_attendance():
     """
     Обрабатывает отправку данных о посещаемости.
-    Сохраняет записи в базе данных на основе JSON-данных.
+    ID студентов проверяются по составу группы одним запросом, посещаемость и письма
+    об отсутствии записываются пакетными INSERT в одной транзакции.
+    Необязательный session_key (UUID, который клиент создаёт в начале занятия) делает
+    повторную отправку идемпотентной: обновляется та же отметка занятия.
     """
     data = request.get_json()
     if not data or 'subject_id' not in data or 'group_id' not in data:
         return jsonify({"success": False, "message": "Нет данных о предмете или группе"}), 400
 
     subject_id = data.get("subject_id")
-    group_id = data.get("group_id")
+    if not str(data.get("group_id")).isdigit():
+        return jsonify({"success": False, "message": "Некорректная группа"}), 400
+    group_id = int(data.get("group_id"))
+    session_key = data.get("session_key") or None
+    if session_key and not SESSION_KEY_RE.match(session_key):
+        return jsonify({"success": False, "message": "Некорректный ключ занятия"}), 400
     user_id = get_jwt_identity()
-    teacher_record = Teacher.query.filter_by(id_user=user_id, id_lesson=subject_id).first()
-    if not teacher_record:
+
+    # Запись преподавателя, предмет и ФИО преподавателя одним запросом
+    teacher_row = db.session.query(Teacher.id, Lesson.lesson, User.fio).join(
+        Lesson, Teacher.id_lesson == Lesson.id
+    ).join(User, Teacher.id_user == User.id).filter(
+        Teacher.id_user == user_id, Teacher.id_lesson == subject_id
+    ).first()
+    if not teacher_row:
         return jsonify({"success": False, "message": "Запись преподавателя не найдена"}), 400
+    teacher_id, subject_name, teacher_fio = teacher_row
 
-    subject = Lesson.query.get(subject_id)
-    if not subject:
-        return jsonify({"success": False, "message": "Предмет не найден"}), 400
-    teacher = User.query.get(user_id)
-    teacher_fio = teacher.fio if teacher else "Преподаватель"
-
-    moscow_tz = pytz.timezone("Europe/Moscow")
-    timestamp = datetime.now(moscow_tz)
-    students_data = data.get("students", [])
-    attended_ids = []
-
-    all_students = Student.query.filter_by(id_group=group_id).all()
-    all_student_ids = {student.id for student in all_students}
-
-    for student in students_data:
-        if student.get("attended"):
-            student_id = int(student.get("id"))
-            if not Student.query.get(student_id):
-                continue
-            attendance = Attendance(
-                timestamp=timestamp,
-                id_teacher=teacher_record.id,
-                id_student=student_id,
-                id_group=group_id
-            )
-            db.session.add(attendance)
-            attended_ids.append(student_id)
-
-    if not attended_ids:
-        attendance = Attendance(
-            timestamp=timestamp,
-            id_teacher=teacher_record.id,
-            id_student=None,
-            id_group=group_id
-        )
-        db.session.add(attendance)
+    # Состав группы: по нему проверяются присланные ID и выбираются отсутствующие
+    roster = db.session.query(Student.id, Student.fio, Student.mail).filter(Student.id_group == group_id).all()
+    roster_ids = {student.id for student in roster}
+    requested_ids = set()
+    for student in data.get("students", []):
+        if student.get("attended") and str(student.get("id", "")).isdigit():
+            requested_ids.add(int(student["id"]))
+    attended_ids = sorted(requested_ids & roster_ids)
 
     try:
+        timestamp = save_attendance(teacher_id, group_id, attended_ids, session_key)
+        # Сводка дня занятия пересчитывается в той же транзакции, что и отметки
+        refresh_rollup(group_id, teacher_id, timestamp.astimezone(moscow_tz).date())
+        # Письма об отсутствии попадают в outbox той же транзакцией, что и посещаемость,
+        # и отправляются рассыльщиком (flask dispatch-emails) вне запроса
+        absent = [student for student in roster if student.id not in requested_ids]
+        queue_absence_emails(absent, subject_name, teacher_fio or "Преподаватель", session_key, attended_ids)
         db.session.commit()
-
-        absent_student_ids = all_student_ids - set(attended_ids)
-        for student_id in absent_student_ids:
-            student = Student.query.get(student_id)
-            if student and student.mail:
-                send_absence_email(student, subject.lesson, teacher_fio)
-
-        return jsonify({"success": True})
+        return jsonify({"success": True, "session_key": session_key})
+    except AttendanceSessionConflict as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": str(e)}), 400
 
 @teacher_bp.route('/api/load_faces', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
 def load_faces():
     """
     Загружает кодировки лиц студентов для указанной группы.
-    Подготавливает данные для распознавания лиц.
+    Подготавливает галерею группы в общем кэше и привязывает её к сессии преподавателя.
     """
     group_name = request.args.get('group')
-    students = Student.query.join(Group).filter(Group.groupname == group_name).all()
-    known_faces = []
-    known_ids = []
-    for student in students:
-        if student.face_encoding:
-            try:
-                encoding_list = json.loads(student.face_encoding)
-                encoding_array = np.array(encoding_list)
-                known_faces.append(encoding_array)
-                known_ids.append(student.id)
-            except Exception as e:
-                print(f"Ошибка при загрузке кодировки для студента {student.id}: {e}")
-    global current_known_faces, current_known_ids
-    current_known_faces = known_faces
-    current_known_ids = known_ids
-    return jsonify({'success': True, 'message': f'Загружено {len(known_ids)} лиц для группы {group_name}'})
+    group = Group.query.filter_by(groupname=group_name).first()
+    if not group:
+        return jsonify({'success': False, 'message': f'Группа {group_name} не найдена'}), 404
+    try:
+        gallery = face_gallery.get(group.id)
+    except GroupNotFound:
+        # Группу удалили между проверкой и сборкой галереи
+        return jsonify({'success': False, 'message': f'Группа {group_name} не найдена'}), 404
+    face_gallery.bind_session(get_jwt_identity(), group.id)
+    return jsonify({
+        'success': True,
+        'group_id': group.id,
+        'message': f'Загружено {len(gallery)} лиц для группы {group_name}'
+    })
+
+# Типы тела запроса, в которых кадр передаётся как есть, без base64 и JSON
+RAW_FRAME_MIMETYPES = {'application/octet-stream', 'image/jpeg', 'image/webp'}
+
+def read_frame_request():
+    """
+    Извлекает из запроса байты кадра и ID группы.
+    Поддерживает multipart/form-data (поле image), бинарное тело JPEG/WebP
+    и прежний JSON с data URL в поле image.
+    """
+    if request.mimetype == 'multipart/form-data':
+        photo = request.files.get('image')
+        image_bytes = photo.read() if photo else None
+        return image_bytes, request.form.get('group_id') or request.args.get('group_id')
+    if request.mimetype in RAW_FRAME_MIMETYPES:
+        return request.get_data(cache=False), request.args.get('group_id')
+
+    data = request.get_json(silent=True) or {}
+    image_data = data.get('image')
+    if not image_data:
+        return None, data.get('group_id')
+    header, encoded = image_data.split(',', 1)
+    return base64.b64decode(encoded), data.get('group_id')
+
+def busy_response(error):
+    """Быстрый ответ 429 при заполненной очереди с подсказкой, через сколько секунд повторить запрос."""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def recognize_frame(user_id, gallery, image_bytes):
+    """
+    Распознает студентов группы на кадре с учётом трекера сессии преподавателя.
+    Возвращает словарь с распознанными студентами и рамками лиц или None,
+    если кадр не удалось декодировать.
+    """
+    # Лица подтверждённых треков берут личность из трека, кодируются только новые
+    tracker = face_trackers.get((user_id, gallery.group_id), current_app.config)
+    with tracker.lock:
+        track_boxes = [track.box for track in tracker.tracks]
+        reusable = [tracker.is_reusable(track) and track.student_id in gallery.names
+                    for track in tracker.tracks]
+        result = face_workers.run(analyze_frame, image_bytes, detection_settings(current_app.config),
+                                  gallery.encoder, track_boxes, reusable, tracker.iou_threshold)
+        if result is None:
+            return None
+
+        face_locations = result['locations']
+        assigned = tracker.resolve(result['assigned'])
+        identities = {
+            face_index: assigned[face_index].student_id
+            for face_index in assigned
+            if face_index not in result['encodings']
+        }
+        to_encode = sorted(result['encodings'])
+        encodings = [result['encodings'][i] for i in to_encode]
+        # Студенты подтверждённых треков уже в кадре или только что вышли из него: их не
+        # присваивают другим лицам; треки перекодируемых лиц проверяются заново
+        exclude_ids = set(identities.values()) | tracker.confirmed_students(
+            assigned[i] for i in to_encode if i in assigned
+        )
+        matches = match_faces(encodings, gallery, current_app.config['FACE_MATCH_TOLERANCE'],
+                              exclude_ids=exclude_ids)
+        for probe_index, student_id, distance in matches:
+            identities[to_encode[probe_index]] = student_id
+        tracker.update(face_locations, assigned, identities, set(to_encode))
+
+    # Уверенно распознанные кадры пополняют эталоны студентов (пачками, см. LiveReferenceBuffer);
+    # сбой записи не мешает распознаванию
+    try:
+        live_references.add(gallery, live_reference_candidates(gallery, matches, encodings, current_app.config))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving live references: {str(e)}")
+
+    return {
+        'recognized': [
+            {"id": student_id, "fio": gallery.names[student_id], "face_index": face_index}
+            for face_index, student_id in sorted(identities.items())
+        ],
+        'face_locations': [[top, right, bottom, left] for (top, right, bottom, left) in face_locations]
+    }
 
 @teacher_bp.route('/api/recognize', methods=['POST'])
-@jwt_required()
 @role_required('teacher')
 def recognize():
     """
     Распознает лица на изображении и возвращает данные о студентах.
-    Принимает base64-изображение, возвращает список распознанных лиц и их координаты.
+    Принимает JPEG/WebP-кадр (multipart, бинарное тело или base64 в JSON),
+    возвращает список распознанных лиц и их координаты.
+    Группа берётся из параметра group_id или из последней загруженной преподавателем галереи.
     """
     try:
-        data = request.json
-        image_data = data.get('image')
-        if not image_data:
+        image_bytes, group_id = read_frame_request()
+        if not image_bytes:
             return jsonify({"error": "No image data provided"}), 400
 
-        header, encoded = image_data.split(',', 1)
-        image_bytes = base64.b64decode(encoded)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            return jsonify({"error": "Failed to decode image"}), 400
-
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-        recognized_students = []
-
-        if not face_encodings:
-            return jsonify({"recognized": [], "face_locations": []})
+        group_id = group_id or face_gallery.session_group(get_jwt_identity())
+        if not group_id:
+            return jsonify({"error": "No known faces loaded. Call /api/load_faces first."}), 400
 
-        if not current_known_faces or not current_known_ids:
+        gallery = face_gallery.get(group_id)
+        if not len(gallery):
             return jsonify({"error": "No known faces loaded. Call /api/load_faces first."}), 400
 
-        for encoding in face_encodings:
-            matches = face_recognition.compare_faces(current_known_faces, encoding)
-            if True in matches:
-                first_match_index = matches.index(True)
-                student_id = current_known_ids[first_match_index]
-                student = Student.query.get(student_id)
-                if student:
-                    recognized_students.append({"id": student_id, "fio": student.fio})
+        result = recognize_frame(get_jwt_identity(), gallery, image_bytes)
+        if result is None:
+            return jsonify({"error": "Failed to decode image"}), 400
+        return jsonify(result)
+
+    except GroupNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except FaceWorkersBusy as e:
+        return busy_response(e)
+    except FaceJobFailed as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"Error in recognize: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Наибольшее число кандидатов, возвращаемых /api/identify для одного лица
+MAX_IDENTIFY_CANDIDATES = 20
 
-        formatted_locations = [[top, right, bottom, left] for (top, right, bottom, left) in face_locations]
-        return jsonify({'recognized': recognized_students, 'face_locations': formatted_locations})
+@teacher_bp.route('/api/identify', methods=['POST'])
+@role_required('teacher')
+def identify():
+    """
+    Опознаёт лица на изображении среди всех студентов, а не только выбранной группы.
+    Принимает кадр так же, как /api/recognize. Для каждого лица возвращает до k ближайших
+    студентов (параметр k) и лучшее совпадение, если оно укладывается в допуск.
+    """
+    try:
+        image_bytes, _ = read_frame_request()
+        if not image_bytes:
+            return jsonify({"error": "No image data provided"}), 400
+        k = max(1, min(request.args.get('k', default=5, type=int), MAX_IDENTIFY_CANDIDATES))
+
+        version = db.session.get(EncoderVersion, face_index.encoder_version)
+        if version is None:
+            return jsonify({"error": f"Encoder version {face_index.encoder_version} is not registered"}), 500
+        result = face_workers.run(analyze_frame, image_bytes, detection_settings(current_app.config),
+                                  encoder_settings(version))
+        if result is None:
+            return jsonify({"error": "Failed to decode image"}), 400
 
+        face_indexes = sorted(result['encodings'])
+        neighbours = face_index.identify([result['encodings'][i] for i in face_indexes], k)
+        candidate_ids = {student_id for candidates in neighbours for student_id, distance in candidates}
+        students = {}
+        if candidate_ids:
+            rows = db.session.query(Student.id, Student.fio, Group.groupname).join(
+                Group, Student.id_group == Group.id
+            ).filter(Student.id.in_(candidate_ids)).all()
+            students = {row.id: row for row in rows}
+
+        tolerance = current_app.config['FACE_MATCH_TOLERANCE']
+        faces = []
+        for i, candidates in zip(face_indexes, neighbours):
+            candidates = [
+                {"id": student_id, "fio": students[student_id].fio,
+                 "group": students[student_id].groupname, "distance": round(distance, 4)}
+                for student_id, distance in candidates
+                if student_id in students
+            ]
+            faces.append({
+                "face_index": i,
+                "face_location": list(result['locations'][i]),
+                "student": candidates[0] if candidates and candidates[0]['distance'] <= tolerance else None,
+                "candidates": candidates
+            })
+        return jsonify({"faces": faces})
+
+    except FaceWorkersBusy as e:
+        return busy_response(e)
+    except FaceJobFailed as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
-        print(f"Error in recognize: {str(e)}")
+        print(f"Error in identify: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# ============================================
+# Потоковое распознавание (Server-Sent Events)
+# ============================================
+
+@teacher_bp.route('/api/stream/frame', methods=['POST'])
+@role_required('teacher')
+def stream_frame():
+    """
+    Принимает кадр потоковой сессии без ожидания распознавания.
+    Кадр заменяет предыдущий необработанный кадр преподавателя; результат придёт в SSE-поток.
+    """
+    image_bytes, group_id = read_frame_request()
+    if not image_bytes:
+        return jsonify({"error": "No image data provided"}), 400
+    user_id = get_jwt_identity()
+    if group_id:
+        if not str(group_id).isdigit():
+            return jsonify({"error": "Некорректная группа"}), 400
+        group_id = int(group_id)
+        if db.session.get(Group, group_id) is None:
+            return jsonify({"error": f"Группа {group_id} не найдена"}), 404
+        face_gallery.bind_session(user_id, group_id)
+    frame_slots.put(user_id, request.args.get('frame_id', ''), image_bytes)
+    return jsonify({"accepted": True}), 202
+
+def sse_event(event, data):
+    """Форматирует событие Server-Sent Events с JSON-данными."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@teacher_bp.route('/api/stream/events', methods=['GET'])
+@role_required('teacher')
+def stream_events():
+    """
+    SSE-поток результатов распознавания для сессии преподавателя.
+    Обрабатывает только самый свежий кадр из слота и отправляет события:
+    faces — рамки и распознанные студенты кадра, student — студент распознан впервые за сессию.
+    Поток требует воркеров с потоками (gthread), так как занимает поток на всё время сессии.
+    """
+    user_id = get_jwt_identity()
+    group_id = request.args.get('group_id', type=int) or face_gallery.session_group(user_id)
+    if not group_id:
+        return jsonify({"error": "No known faces loaded. Call /api/load_faces first."}), 400
+    if db.session.get(Group, group_id) is None:
+        return jsonify({"error": f"Группа {group_id} не найдена"}), 404
+    poll_interval = current_app.config['FACE_STREAM_POLL_INTERVAL']
+    heartbeat_interval = current_app.config['FACE_STREAM_HEARTBEAT']
+    idle_timeout = current_app.config['FACE_STREAM_IDLE_TIMEOUT']
+    # Последний кадр предыдущей сессии мог быть снят на другом занятии: он не распознаётся
+    # по группе новой сессии
+    frame_slots.clear(user_id)
+
+    def generate():
+        version = None
+        seen_students = set()
+        last_frame_at = last_event_at = time.monotonic()
+        yield "retry: 3000\n\n"
+        # Соединение с БД не должно удерживаться на всё время потока
+        db.session.remove()
+        try:
+            while True:
+                frame = frame_slots.take_newer(user_id, version)
+                now = time.monotonic()
+                if frame is None:
+                    if now - last_frame_at > idle_timeout:
+                        yield sse_event('end', {"reason": "idle"})
+                        return
+                    if now - last_event_at > heartbeat_interval:
+                        last_event_at = now
+                        yield ": heartbeat\n\n"
+                    time.sleep(poll_interval)
+                    continue
+
+                version, frame_id, image_bytes = frame
+                last_frame_at = last_event_at = now
+                try:
+                    gallery = face_gallery.get(group_id)
+                    result = recognize_frame(user_id, gallery, image_bytes)
+                except GroupNotFound:
+                    # Группу удалили во время сессии
+                    yield sse_event('end', {"reason": "group_not_found"})
+                    return
+                except (FaceWorkersBusy, FaceJobFailed):
+                    # Кадр пропускается: к следующей проверке придёт более свежий
+                    continue
+                except Exception as e:
+                    print(f"Error in stream_events: {str(e)}")
+                    yield sse_event('frame_error', {"frame_id": frame_id, "error": str(e)})
+                    continue
+                finally:
+                    db.session.remove()
+
+                if result is None:
+                    yield sse_event('frame_error', {"frame_id": frame_id, "error": "Failed to decode image"})
+                    continue
+                yield sse_event('faces', {"frame_id": frame_id, **result})
+                for student in result['recognized']:
+                    if student['id'] not in seen_students:
+                        seen_students.add(student['id'])
+                        yield sse_event('student', {"id": student['id'], "fio": student['fio']})
+        finally:
+            # Кадр не должен достаться следующей сессии преподавателя
+            frame_slots.clear(user_id)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # ============================================
 # Управление пользователями
 # ============================================
@@ -497,37 +644,32 @@ def update_password(user_id):
     if not user:
         return jsonify({"success": False, "message": "Пользователь не найден"}), 404
 
-    current_user_id = get_jwt_identity()
-    if user.id == current_user_id and user.first_start:
+    if user.id == int(get_jwt_identity()) and user.first_start:
         user.first_start = False
 
     user.password = generate_password_hash(new_password, method='pbkdf2:sha256', salt_length=8)
     db.session.commit()
+    identity_cache.invalidate()
     return jsonify({"success": True})
 
 @teacher_bp.route('/api/students', methods=['GET'])
-@jwt_required()
 @role_required('teacher')
 def get_students():
     """
-    Возвращает список студентов с фильтрацией по группе.
+    Возвращает список студентов с фильтрацией по группе (group — название) и началу ФИО (q).
     Используется для отображения информации о студентах.
+    С параметрами limit/after отдаёт одну страницу с next_cursor и total.
     """
     group_name = request.args.get('group')
-    query = Student.query
+    group_id = None
     if group_name:
         group_obj = Group.query.filter_by(groupname=group_name).first()
-        if group_obj:
-            query = query.filter_by(id_group=group_obj.id)
-        else:
+        if not group_obj:
             return jsonify({'success': True, 'students': []})
-    students = query.all()
-    result = [{
-        'id': student.id,
-        'student_id_display': f"{'Б' if student.education_form == 'бюджетная' else 'В'}{str(student.id)[:2]}-{str(student.id)[2:]}",
-        'fio': student.fio,
-        'group': student.group.groupname,
-        'mail': student.mail,
-        'birth_date': student.birth_date.strftime('%Y-%m-%d')
-    } for student in students]
-    return jsonify({'success': True, 'students': result})
\ No newline at end of file
+        group_id = group_obj.id
+    query = student_rows(group_id, request.args.get('q'))
+    try:
+        students, page = listing(query, STUDENT_ORDER, student_to_dict, request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'students': students, **(page or {})})
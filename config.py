@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -22,6 +23,11 @@ class Config:
     # Отключаем куки
     JWT_COOKIE_CSRF_PROTECT = True
     JWT_SESSION_COOKIE = False
+    # Время жизни записи кэша пользователей в секундах: удалённый пользователь теряет доступ
+    # не позже чем через это время даже без сброса кэша
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 30))
+    # Потоки для вычисления хэшей паролей при пакетной регистрации (PBKDF2 в hashlib отпускает GIL)
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(8, os.cpu_count() or 1)))
 
     # Подключение бд
     SQLALCHEMY_DATABASE_URI = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
@@ -30,9 +36,96 @@ class Config:
     # Путь до папки с фото
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'photos')
 
+    # Каталог для данных распознавания, общих для всех воркеров хоста (по умолчанию в памяти)
+    FACE_CACHE_DIR = os.getenv(
+        'FACE_CACHE_DIR',
+        os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'face_recognition_students')
+    )
+    # Максимальное количество галерей групп, одновременно хранимых в памяти процесса
+    FACE_GALLERY_MAX_GROUPS = int(os.getenv('FACE_GALLERY_MAX_GROUPS', 32))
+    # Максимальное количество закэшированных ответов справочных API фильтров в процессе
+    LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv('LOOKUP_CACHE_MAX_ENTRIES', 512))
+    # Детектор лиц работает на кадре, уменьшенном в FACE_DETECTION_SCALE раз,
+    # а кодировки вычисляются по исходному кадру
+    FACE_DETECTION_SCALE = float(os.getenv('FACE_DETECTION_SCALE', 0.5))
+    # Количество увеличений кадра детектором HOG (помогает находить мелкие лица)
+    FACE_DETECTION_UPSAMPLE = int(os.getenv('FACE_DETECTION_UPSAMPLE', 1))
+    # Минимальный размер лица в пикселях исходного кадра
+    FACE_MIN_SIZE = int(os.getenv('FACE_MIN_SIZE', 40))
+    # Модель детектора: 'hog' (CPU) или 'cnn' (GPU)
+    FACE_DETECTION_MODEL = os.getenv('FACE_DETECTION_MODEL', 'hog')
+    # Сопоставление лиц между кадрами: минимальный IoU рамок одного трека,
+    # число совпадений для подтверждения трека и число кадров без лица до удаления трека
+    FACE_TRACK_IOU_THRESHOLD = float(os.getenv('FACE_TRACK_IOU_THRESHOLD', 0.3))
+    FACE_TRACK_CONFIRM_HITS = int(os.getenv('FACE_TRACK_CONFIRM_HITS', 2))
+    FACE_TRACK_MAX_MISSED = int(os.getenv('FACE_TRACK_MAX_MISSED', 2))
+    # Через сколько кадров подтверждённый трек кодируется повторно для перепроверки
+    FACE_TRACK_REVERIFY_FRAMES = int(os.getenv('FACE_TRACK_REVERIFY_FRAMES', 10))
+    # Время жизни неиспользуемого трекера сессии в секундах
+    FACE_TRACK_SESSION_TTL = int(os.getenv('FACE_TRACK_SESSION_TTL', 600))
+    # Пул процессов для детекции и кодирования лиц. По умолчанию ядра делятся
+    # между воркерами gunicorn (WEB_CONCURRENCY), чтобы не перегружать процессор
+    FACE_WORKERS = int(os.getenv(
+        'FACE_WORKERS',
+        max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY', 1)))
+    ))
+    # Сколько задач может ждать в очереди сверх выполняемых
+    FACE_QUEUE_SIZE = int(os.getenv('FACE_QUEUE_SIZE', 4))
+    # Сколько задач фонового добавления студентов может одновременно занимать пул;
+    # 0 — на один меньше FACE_WORKERS, чтобы распознаванию всегда оставался процесс
+    FACE_BACKGROUND_JOBS = int(os.getenv('FACE_BACKGROUND_JOBS', 0))
+    # Максимальное время обработки одной задачи в секундах
+    FACE_JOB_TIMEOUT = float(os.getenv('FACE_JOB_TIMEOUT', 10))
+    # Подсказка клиенту (Retry-After), через сколько секунд повторить запрос при переполнении очереди
+    FACE_RETRY_AFTER = int(os.getenv('FACE_RETRY_AFTER', 2))
+    # Способ запуска процессов пула: fork, forkserver или spawn
+    FACE_WORKER_START_METHOD = os.getenv('FACE_WORKER_START_METHOD', 'forkserver')
+    # Загружать модели в мастере gunicorn до запуска воркеров (gunicorn.conf.py);
+    # процессы пула тогда создаются через fork и разделяют память моделей
+    FACE_PRELOAD_MODELS = os.getenv('FACE_PRELOAD_MODELS', 'true').lower() == 'true'
+    # Потоковое распознавание: период проверки нового кадра, интервал heartbeat
+    # и время без кадров, после которого SSE-поток закрывается (в секундах)
+    FACE_STREAM_POLL_INTERVAL = float(os.getenv('FACE_STREAM_POLL_INTERVAL', 0.1))
+    FACE_STREAM_HEARTBEAT = float(os.getenv('FACE_STREAM_HEARTBEAT', 15))
+    FACE_STREAM_IDLE_TIMEOUT = float(os.getenv('FACE_STREAM_IDLE_TIMEOUT', 60))
+    # Модель, которой вычисляются и сопоставляются кодировки лиц
+    FACE_ENCODING_MODEL = os.getenv('FACE_ENCODING_MODEL', 'dlib_resnet_v1')
+    # Максимальное расстояние между кодировками, при котором лица считаются совпадающими
+    FACE_MATCH_TOLERANCE = float(os.getenv('FACE_MATCH_TOLERANCE', 0.6))
+    # Живые эталоны: кадр, распознанный с расстоянием не больше FACE_REFERENCE_ADD_DISTANCE
+    # и отстоящий от имеющихся эталонов хотя бы на FACE_REFERENCE_MIN_NOVELTY, становится
+    # новым эталоном студента, пока их не больше FACE_REFERENCE_MAX (1 — только фото)
+    FACE_REFERENCE_MAX = int(os.getenv('FACE_REFERENCE_MAX', 5))
+    FACE_REFERENCE_ADD_DISTANCE = float(os.getenv('FACE_REFERENCE_ADD_DISTANCE', 0.4))
+    FACE_REFERENCE_MIN_NOVELTY = float(os.getenv('FACE_REFERENCE_MIN_NOVELTY', 0.15))
+    # Живые эталоны записываются пачкой не чаще раза в FACE_REFERENCE_FLUSH_INTERVAL секунд,
+    # от одного студента — не чаще раза в FACE_REFERENCE_STUDENT_INTERVAL секунд
+    FACE_REFERENCE_FLUSH_INTERVAL = int(os.getenv('FACE_REFERENCE_FLUSH_INTERVAL', 60))
+    FACE_REFERENCE_STUDENT_INTERVAL = int(os.getenv('FACE_REFERENCE_STUDENT_INTERVAL', 300))
+    # Индекс опознавания по всему контингенту: версия кодировщика, число кластеров IVF
+    # (0 — подбирается по числу студентов), число просматриваемых кластеров и доля
+    # накопленных изменений, после которой индекс перестраивается заново
+    FACE_INDEX_ENCODER_VERSION = os.getenv('FACE_INDEX_ENCODER_VERSION', FACE_ENCODING_MODEL)
+    FACE_INDEX_NLIST = int(os.getenv('FACE_INDEX_NLIST', 0))
+    FACE_INDEX_NPROBE = int(os.getenv('FACE_INDEX_NPROBE', 16))
+    FACE_INDEX_REBUILD_RATIO = float(os.getenv('FACE_INDEX_REBUILD_RATIO', 0.2))
+
     # Получение данных почтового клиента
     MAIL_HOST = os.getenv("MAIL_HOST")
     MAIL_PORT = int(os.getenv("MAIL_PORT", 465))
     MAIL_USERNAME = os.getenv("MAIL_USERNAME")
     MAIL_FROM = os.getenv("MAIL_FROM")
     MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+    # SMTP_SSL (порт 465) или обычный SMTP со STARTTLS; без STARTTLS — для локального тестового сервера
+    MAIL_USE_SSL = os.getenv("MAIL_USE_SSL", "true").lower() == "true"
+    MAIL_USE_STARTTLS = os.getenv("MAIL_USE_STARTTLS", "false").lower() == "true"
+    MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", 30))
+    # Рассылка из outbox: размер пачки, не больше MAIL_RATE_LIMIT писем в секунду,
+    # до MAIL_MAX_ATTEMPTS попыток с экспоненциальной задержкой от MAIL_RETRY_BASE_DELAY
+    # до MAIL_RETRY_MAX_DELAY секунд, опрос очереди раз в MAIL_POLL_INTERVAL секунд
+    MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 50))
+    MAIL_RATE_LIMIT = float(os.getenv("MAIL_RATE_LIMIT", 5))
+    MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+    MAIL_RETRY_BASE_DELAY = float(os.getenv("MAIL_RETRY_BASE_DELAY", 30))
+    MAIL_RETRY_MAX_DELAY = float(os.getenv("MAIL_RETRY_MAX_DELAY", 3600))
+    MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", 5))
@@ -0,0 +1,34 @@
+# Конфигурация gunicorn: gunicorn -c gunicorn.conf.py
+# Приложение загружается в мастере (preload_app), там же загружаются и прогреваются
+# модели распознавания. Воркеры и их пулы распознавания создаются через fork и разделяют
+# страницы моделей с мастером (copy-on-write) вместо собственной копии в каждом процессе.
+import os
+from concurrent.futures import wait
+
+wsgi_app = 'run:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+# То же значение используется в config.py для деления ядер между пулами распознавания
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+# Потоки нужны для SSE-потоков распознавания, которые держат соединение открытым
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = True
+
+
+def on_starting(server):
+    # Вызывается в мастере после загрузки приложения, но до открытия сокета:
+    # запросы начинают приниматься только после прогрева моделей
+    from app.services.face_workers import face_workers
+    if face_workers.preload:
+        server.log.info('Загрузка моделей распознавания')
+        face_workers.preload_models()
+
+
+def post_fork(server, worker):
+    # Процессы пула запускаются сразу после fork, пока воркер ещё однопоточный,
+    # и воркер начинает обслуживать запросы с прогретым пулом
+    from app.services.face_workers import face_workers
+    done, not_done = wait(face_workers.warm_up(), timeout=face_workers.job_timeout * 3)
+    if not_done or any(future.exception() for future in done):
+        worker.log.warning('Прогрев пула распознавания не завершён, /ready ответит 503')
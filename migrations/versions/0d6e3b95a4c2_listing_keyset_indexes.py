@@ -0,0 +1,38 @@
+"""Indexes for keyset-paginated student and user listings
+
+Revision ID: 0d6e3b95a4c2
+Revises: f2b9c07e5d18
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d6e3b95a4c2'
+down_revision = 'f2b9c07e5d18'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_students_fio_id', 'students', ['fio', 'id']),
+    ('ix_students_group_fio_id', 'students', ['id_group', 'fio', 'id']),
+    ('ix_students_fio_prefix', 'students', [sa.text('lower(fio) text_pattern_ops')]),
+    ('ix_students_mail_prefix', 'students', [sa.text('lower(mail) text_pattern_ops')]),
+    ('ix_users_fio_id', 'users', ['fio', 'id']),
+    ('ix_users_fio_prefix', 'users', [sa.text('lower(fio) text_pattern_ops')]),
+    ('ix_users_mail_prefix', 'users', [sa.text('lower(mail) text_pattern_ops')]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
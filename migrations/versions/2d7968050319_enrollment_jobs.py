@@ -0,0 +1,39 @@
+"""Background enrollment jobs
+
+Revision ID: 2d7968050319
+Revises: 493faa582b8a
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7968050319'
+down_revision = '493faa582b8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('enrollment_jobs'):
+        return
+    op.create_table(
+        'enrollment_jobs',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('results', sa.Text(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('id_group', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['id_group'], ['groups.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('enrollment_jobs')
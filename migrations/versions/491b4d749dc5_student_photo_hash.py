@@ -0,0 +1,26 @@
+"""Content hash of student photos for resumable bulk enrollment
+
+Revision ID: 491b4d749dc5
+Revises: 2d7968050319
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '491b4d749dc5'
+down_revision = '2d7968050319'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('students')}
+    if 'photo_hash' not in columns:
+        op.add_column('students', sa.Column('photo_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('students', 'photo_hash')
@@ -0,0 +1,83 @@
+"""Binary float32 face embeddings instead of JSON text
+
+Revision ID: 493faa582b8a
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = '493faa582b8a'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Количество студентов, перекодируемых за один проход
+BATCH_SIZE = 500
+# Тег модели, которой были вычислены все существующие кодировки
+LEGACY_ENCODING_MODEL = 'dlib_resnet_v1'
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    columns = _columns('students')
+    if 'face_embedding' not in columns:
+        op.add_column('students', sa.Column('face_embedding', sa.LargeBinary(), nullable=True))
+    if 'encoding_model' not in columns:
+        op.add_column('students', sa.Column('encoding_model', sa.String(length=32), nullable=True))
+    if 'face_encoding' not in columns:
+        return
+
+    # Перенос существующих JSON-кодировок пачками по возрастанию ID
+    bind = op.get_bind()
+    last_id = None
+    while True:
+        query = ("SELECT id, face_encoding FROM students "
+                 "WHERE face_encoding IS NOT NULL AND face_embedding IS NULL")
+        params = {'limit': BATCH_SIZE}
+        if last_id is not None:
+            query += " AND id > :last_id"
+            params['last_id'] = last_id
+        rows = bind.execute(sa.text(query + " ORDER BY id LIMIT :limit"), params).fetchall()
+        if not rows:
+            break
+        updates = []
+        for student_id, face_encoding in rows:
+            try:
+                embedding = np.asarray(json.loads(face_encoding), dtype='<f4').tobytes()
+            except (TypeError, ValueError):
+                continue
+            updates.append({'id': student_id, 'embedding': embedding, 'model': LEGACY_ENCODING_MODEL})
+        if updates:
+            bind.execute(
+                sa.text("UPDATE students SET face_embedding = :embedding, encoding_model = :model WHERE id = :id"),
+                updates
+            )
+        last_id = rows[-1][0]
+
+    op.drop_column('students', 'face_encoding')
+
+
+def downgrade():
+    op.add_column('students', sa.Column('face_encoding', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT id, face_embedding FROM students WHERE face_embedding IS NOT NULL"))
+    updates = [
+        {'id': student_id, 'encoding': json.dumps(np.frombuffer(embedding, dtype='<f4').astype(float).tolist())}
+        for student_id, embedding in rows
+    ]
+    if updates:
+        bind.execute(sa.text("UPDATE students SET face_encoding = :encoding WHERE id = :id"), updates)
+
+    op.drop_column('students', 'encoding_model')
+    op.drop_column('students', 'face_embedding')
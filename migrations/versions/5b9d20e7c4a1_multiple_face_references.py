@@ -0,0 +1,46 @@
+"""Several reference embeddings per student
+
+Revision ID: 5b9d20e7c4a1
+Revises: 7c3e51a0d9f2
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9d20e7c4a1'
+down_revision = '7c3e51a0d9f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('face_embeddings')}
+    if 'source' not in columns:
+        op.add_column('face_embeddings', sa.Column('source', sa.String(length=16), nullable=False,
+                                                   server_default='enrollment'))
+        op.alter_column('face_embeddings', 'source', server_default=None)
+    constraints = {constraint['name'] for constraint in inspector.get_unique_constraints('face_embeddings')}
+    if 'unique_student_encoder_version' in constraints:
+        op.drop_constraint('unique_student_encoder_version', 'face_embeddings', type_='unique')
+    indexes = {index['name'] for index in inspector.get_indexes('face_embeddings')}
+    if 'ix_face_embeddings_student_encoder_version' not in indexes:
+        op.create_index('ix_face_embeddings_student_encoder_version', 'face_embeddings',
+                        ['id_student', 'encoder_version'])
+
+
+def downgrade():
+    # Остаётся только эталон с фото при добавлении (или самый ранний) для каждой версии
+    op.get_bind().execute(sa.text(
+        "DELETE FROM face_embeddings e USING face_embeddings k "
+        "WHERE e.id_student = k.id_student AND e.encoder_version = k.encoder_version "
+        "AND (e.source <> 'enrollment' AND k.source = 'enrollment' "
+        "     OR (e.source = 'enrollment') = (k.source = 'enrollment') AND e.id > k.id)"
+    ))
+    op.drop_index('ix_face_embeddings_student_encoder_version', table_name='face_embeddings')
+    op.create_unique_constraint('unique_student_encoder_version', 'face_embeddings',
+                                ['id_student', 'encoder_version'])
+    op.drop_column('face_embeddings', 'source')
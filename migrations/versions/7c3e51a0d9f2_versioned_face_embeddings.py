@@ -0,0 +1,96 @@
+"""Face embeddings per encoder version
+
+Revision ID: 7c3e51a0d9f2
+Revises: 491b4d749dc5
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e51a0d9f2'
+down_revision = '491b4d749dc5'
+branch_labels = None
+depends_on = None
+
+# Версия кодировщика, которой были вычислены все существующие кодировки
+LEGACY_ENCODER_VERSION = 'dlib_resnet_v1'
+
+
+def _tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    tables = _tables()
+    if 'encoder_versions' not in tables:
+        op.create_table(
+            'encoder_versions',
+            sa.Column('name', sa.String(length=32), primary_key=True),
+            sa.Column('num_jitters', sa.Integer(), nullable=False),
+            sa.Column('landmarks_model', sa.String(length=10), nullable=False)
+        )
+    if 'face_embeddings' not in tables:
+        op.create_table(
+            'face_embeddings',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('id_student', sa.Integer(), sa.ForeignKey('students.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('encoder_version', sa.String(length=32), sa.ForeignKey('encoder_versions.name'),
+                      nullable=False),
+            sa.Column('embedding', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+            sa.UniqueConstraint('id_student', 'encoder_version', name='unique_student_encoder_version')
+        )
+    if 'encoder_version' not in _columns('groups'):
+        op.add_column('groups', sa.Column('encoder_version', sa.String(length=32),
+                                          sa.ForeignKey('encoder_versions.name'), nullable=True))
+
+    bind = op.get_bind()
+    bind.execute(sa.text(
+        "INSERT INTO encoder_versions (name, num_jitters, landmarks_model) "
+        "VALUES (:name, 1, 'small') ON CONFLICT (name) DO NOTHING"
+    ), {'name': LEGACY_ENCODER_VERSION})
+
+    student_columns = _columns('students')
+    if 'face_embedding' not in student_columns:
+        return
+
+    # Перенос кодировок из таблицы студентов одним INSERT ... SELECT. Уже перенесённые
+    # пропускаются через NOT EXISTS: уникального ограничения может не быть, если таблицу
+    # создал create_all по модели, где оно заменено индексом (см. 5b9d20e7c4a1)
+    bind.execute(sa.text(
+        "INSERT INTO encoder_versions (name, num_jitters, landmarks_model) "
+        "SELECT DISTINCT encoding_model, 1, 'small' FROM students "
+        "WHERE encoding_model IS NOT NULL ON CONFLICT (name) DO NOTHING"
+    ))
+    bind.execute(sa.text(
+        "INSERT INTO face_embeddings (id_student, encoder_version, embedding, created_at) "
+        "SELECT s.id, COALESCE(s.encoding_model, :legacy), s.face_embedding, now() FROM students s "
+        "WHERE s.face_embedding IS NOT NULL AND NOT EXISTS ("
+        "    SELECT 1 FROM face_embeddings e "
+        "    WHERE e.id_student = s.id AND e.encoder_version = COALESCE(s.encoding_model, :legacy))"
+    ), {'legacy': LEGACY_ENCODER_VERSION})
+
+    op.drop_column('students', 'face_embedding')
+    op.drop_column('students', 'encoding_model')
+
+
+def downgrade():
+    op.add_column('students', sa.Column('face_embedding', sa.LargeBinary(), nullable=True))
+    op.add_column('students', sa.Column('encoding_model', sa.String(length=32), nullable=True))
+    # Возвращается кодировка активной версии группы (или версии по умолчанию)
+    op.get_bind().execute(sa.text(
+        "UPDATE students s SET face_embedding = e.embedding, encoding_model = e.encoder_version "
+        "FROM face_embeddings e, groups g "
+        "WHERE e.id_student = s.id AND g.id = s.id_group "
+        "AND e.encoder_version = COALESCE(g.encoder_version, :legacy)"
+    ), {'legacy': LEGACY_ENCODER_VERSION})
+    op.drop_column('groups', 'encoder_version')
+    op.drop_table('face_embeddings')
+    op.drop_table('encoder_versions')
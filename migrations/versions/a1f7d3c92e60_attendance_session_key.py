@@ -0,0 +1,40 @@
+"""Attendance session key for idempotent submission and outbox deduplication
+
+Revision ID: a1f7d3c92e60
+Revises: 8e41c6b2a7d3
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f7d3c92e60'
+down_revision = '8e41c6b2a7d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'session_key' not in {column['name'] for column in inspector.get_columns('attendance')}:
+        op.add_column('attendance', sa.Column('session_key', sa.String(length=36), nullable=True))
+    indexes = {index['name'] for index in inspector.get_indexes('attendance')}
+    if 'unique_attendance_session_student' not in indexes:
+        op.create_index('unique_attendance_session_student', 'attendance', ['session_key', 'id_student'], unique=True)
+    if 'unique_attendance_session_empty' not in indexes:
+        op.create_index('unique_attendance_session_empty', 'attendance', ['session_key'], unique=True,
+                        postgresql_where=sa.text('id_student IS NULL'))
+
+    if 'dedup_key' not in {column['name'] for column in inspector.get_columns('email_outbox')}:
+        op.add_column('email_outbox', sa.Column('dedup_key', sa.String(length=100), nullable=True))
+        op.create_unique_constraint('email_outbox_dedup_key_key', 'email_outbox', ['dedup_key'])
+
+
+def downgrade():
+    op.drop_constraint('email_outbox_dedup_key_key', 'email_outbox', type_='unique')
+    op.drop_column('email_outbox', 'dedup_key')
+    op.drop_index('unique_attendance_session_empty', table_name='attendance')
+    op.drop_index('unique_attendance_session_student', table_name='attendance')
+    op.drop_column('attendance', 'session_key')
@@ -0,0 +1,49 @@
+"""Attendance rollups per group, teacher record and lesson day
+
+Revision ID: c4e8a2d61f07
+Revises: a1f7d3c92e60
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2d61f07'
+down_revision = 'a1f7d3c92e60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('attendance_rollups'):
+        op.create_table(
+            'attendance_rollups',
+            sa.Column('id_group', sa.Integer(), nullable=False),
+            sa.Column('id_teacher', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('present_count', sa.Integer(), nullable=False),
+            sa.Column('present_students', postgresql.ARRAY(sa.Integer()), nullable=False),
+            sa.ForeignKeyConstraint(['id_group'], ['groups.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['id_teacher'], ['teachers.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id_group', 'id_teacher', 'day')
+        )
+
+    # Сводки по уже накопленным отметкам; существующие строки не перезаписываются
+    op.execute("""
+        INSERT INTO attendance_rollups (id_group, id_teacher, day, present_count, present_students)
+        SELECT id_group,
+               id_teacher,
+               date(timezone('Europe/Moscow', timestamp)),
+               count(DISTINCT id_student),
+               coalesce(array_agg(DISTINCT id_student) FILTER (WHERE id_student IS NOT NULL), '{}'::integer[])
+        FROM attendance
+        GROUP BY 1, 2, 3
+        ON CONFLICT (id_group, id_teacher, day) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.drop_table('attendance_rollups')
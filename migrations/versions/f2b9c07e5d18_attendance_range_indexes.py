@@ -0,0 +1,35 @@
+"""Composite indexes for attendance range queries
+
+Revision ID: f2b9c07e5d18
+Revises: c4e8a2d61f07
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9c07e5d18'
+down_revision = 'c4e8a2d61f07'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_attendance_group_timestamp', 'attendance', ['id_group', 'timestamp']),
+    ('ix_attendance_teacher_timestamp', 'attendance', ['id_teacher', 'timestamp']),
+    ('ix_attendance_student', 'attendance', ['id_student']),
+    ('ix_attendance_rollups_teacher_day', 'attendance_rollups', ['id_teacher', 'day']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,88 @@
+"""
+Замер времени запуска приложения: импорт пакета app, create_app() и CLI-команды flask.
+Каждый замер выполняется в отдельном процессе интерпретатора, как при перезапуске
+воркера gunicorn или вызове команды flask.
+
+    python scripts/startup_benchmark.py --runs 5
+    python scripts/startup_benchmark.py --root ../attendance-old   # для сравнения с другой копией
+
+Для каждого замера печатаются медиана и минимум в миллисекундах, а также тяжёлые
+модули, которые оказались импортированы после create_app().
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Модули, которые не должны загружаться в веб-процессе без распознавания лиц
+HEAVY_MODULES = ('face_recognition', 'dlib', 'cv2', 'scipy', 'numpy', 'openpyxl')
+
+CREATE_APP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import': (imported - started) * 1000,
+    'create_app': (created - imported) * 1000,
+    'heavy': [name for name in %r if name in sys.modules],
+}))
+'''
+
+
+def probe_create_app(root, runs):
+    """Возвращает замеры импорта app и create_app() и список загруженных тяжёлых модулей."""
+    results = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, '-c', CREATE_APP_PROBE % (HEAVY_MODULES,)],
+            cwd=root, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            sys.exit(f'create_app() завершился с ошибкой:\n{process.stderr}')
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def time_command(root, args, runs):
+    """Возвращает время выполнения команды в миллисекундах для каждого запуска."""
+    env = dict(os.environ, FLASK_APP='app')
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f'{label:<32} медиана {statistics.median(timings):8.1f} мс   минимум {min(timings):8.1f} мс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени запуска приложения и CLI-команд.')
+    parser.add_argument('--root', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='Каталог копии проекта (по умолчанию — текущая).')
+    parser.add_argument('--runs', type=int, default=5, help='Число запусков каждого замера.')
+    args = parser.parse_args()
+
+    probes = probe_create_app(args.root, args.runs)
+    report('import app', [probe['import'] for probe in probes])
+    report('create_app()', [probe['create_app'] for probe in probes])
+    report('import app + create_app()', [probe['import'] + probe['create_app'] for probe in probes])
+
+    flask = [sys.executable, '-m', 'flask']
+    report('flask --help', time_command(args.root, flask + ['--help'], args.runs))
+    report('flask rebuild-rollups --help', time_command(args.root, flask + ['rebuild-rollups', '--help'], args.runs))
+
+    heavy = probes[-1]['heavy']
+    print('Тяжёлые модули после create_app():', ', '.join(heavy) if heavy else 'нет')
+
+
+if __name__ == '__main__':
+    main()